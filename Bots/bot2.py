@@ -8,17 +8,24 @@ import discord
 from discord.ext import commands, tasks
 from discord.ui import View, button, Button
 import asyncio
+import bisect
+import functools
+import hashlib
+import heapq
+import itertools
 import re
 import aiohttp
 import os
 import json
 import random
 import sqlite3
+import threading
 import io
 import time
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from PIL import Image, ImageDraw, ImageFont
-from collections import deque
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, Tuple
 
 
@@ -138,10 +145,10 @@ async def cancel_match(guild: discord.Guild, admin_msg_id: int, reason: str = "C
     """
     Cancels an in-progress 1v1 without recording a result.
     - Marks the match as resolved
-    - Cleans up temp text/voice/category channels if present
     - Updates the admin results message to reflect cancellation
-    - Notifies players in the private text room
+    - Notifies players in the private text room, then releases the rooms
     - Edits the public announce card to show 'CANCELLED'
+    The three Discord-facing steps don't depend on each other and run concurrently.
     """
     match = MATCHES.get(admin_msg_id)
     if not match or match.get("resolved"):
@@ -156,96 +163,130 @@ async def cancel_match(guild: discord.Guild, admin_msg_id: int, reason: str = "C
     match["resolved"] = True
 
     # 1) Admin results message → mark CANCELLED
-    try:
+    async def _admin_card():
         admin_chan = guild.get_channel(WIN_REPORT_CHANNEL_ID)
-        if isinstance(admin_chan, (discord.TextChannel, discord.Thread)):
-            admin_msg = await admin_chan.fetch_message(admin_msg_id)
-            new_content = f"~~{admin_msg.content}~~\n**⛔ Match CANCELLED.** {reason}"
-            if admin_msg.embeds:
-                from copy import deepcopy
-                emb = deepcopy(admin_msg.embeds[0])
-                emb.title = (emb.title or "Match") + " — CANCELLED"
-                await admin_msg.edit(content=new_content, embed=emb)
-            else:
-                await admin_msg.edit(content=new_content)
+        if not isinstance(admin_chan, (discord.TextChannel, discord.Thread)):
+            return
+        admin_msg = await admin_chan.fetch_message(admin_msg_id)
+        new_content = f"~~{admin_msg.content}~~\n**⛔ Match CANCELLED.** {reason}"
+        if admin_msg.embeds:
+            from copy import deepcopy
+            emb = deepcopy(admin_msg.embeds[0])
+            emb.title = (emb.title or "Match") + " — CANCELLED"
+            await admin_msg.edit(content=new_content, embed=emb)
+        else:
+            await admin_msg.edit(content=new_content)
+        try:
+            await admin_msg.clear_reactions()
+        except Exception:
+            pass
+
+    # 2) Notify in the private text room (if it exists), then release text/voice/category
+    async def _rooms():
+        text_id = match.get("text_chan_id")
+        room = guild.get_channel(text_id) if text_id else None
+        if isinstance(room, (discord.TextChannel, discord.Thread)):
+            tag_a = a_member.mention if a_member else f"<@{a_id}>"
+            tag_b = b_member.mention if b_member else f"<@{b_id}>"
+            admin_tag = actor.mention if actor else "an admin"
             try:
-                await admin_msg.clear_reactions()
+                await room.send(f"{tag_a} {tag_b} — **This 1v1 has been cancelled by {admin_tag}.** Reason: {reason}")
             except Exception:
                 pass
-    except Exception:
-        pass
-
-    # 2) Notify in the private text room (if it exists)
-    try:
-        text_id = match.get("text_chan_id") or match.get("text_channel_id") or match.get("channel_id")
-        if text_id:
-            room = guild.get_channel(text_id)
-            if isinstance(room, (discord.TextChannel, discord.Thread)):
-                tag_a = a_member.mention if a_member else f"<@{a_id}>"
-                tag_b = b_member.mention if b_member else f"<@{b_id}>"
-                admin_tag = actor.mention if actor else "an admin"
-                await room.send(f"{tag_a} {tag_b} — **This 1v1 has been cancelled by {admin_tag}.** Reason: {reason}")
-    except Exception:
-        pass
+        await _release_rooms(guild, text_id, match.get("voice_chan_id"), reason="1v1 cancelled")
+        cat = guild.get_channel(match["category_id"]) if match.get("category_id") else None
+        if isinstance(cat, discord.CategoryChannel):
+            await cat.delete(reason="1v1 cancelled")
 
     # 3) Public announce card → edit to CANCELLED if present
-    try:
+    async def _announce_card():
         ann_id = match.get("announce_msg_id")
         ann_ch_id = match.get("announce_ch_id")
-        if ann_id and ann_ch_id:
-            ann_ch = guild.get_channel(ann_ch_id) or await guild.fetch_channel(ann_ch_id)
-            if isinstance(ann_ch, (discord.TextChannel, discord.Thread)):
-                ann_msg = await ann_ch.fetch_message(ann_id)
-                # prefer editing the embed if any
-                if ann_msg.embeds:
-                    from copy import deepcopy
-                    pub = deepcopy(ann_msg.embeds[0])
-                    pub.title = (pub.title or "1v1") + " — CANCELLED"
-                    pub.set_footer(text=f"Cancelled by {actor.display_name if actor else 'admin'}")
-                    await ann_msg.edit(content="**⛔ This match was CANCELLED by admin.**", embed=pub)
-                else:
-                    await ann_msg.edit(content="**⛔ This match was CANCELLED by admin.**")
-    except Exception:
-        pass
+        if not (ann_id and ann_ch_id):
+            return
+        ann_ch = guild.get_channel(ann_ch_id) or await guild.fetch_channel(ann_ch_id)
+        if not isinstance(ann_ch, (discord.TextChannel, discord.Thread)):
+            return
+        ann_msg = await ann_ch.fetch_message(ann_id)
+        # prefer editing the embed if any
+        if ann_msg.embeds:
+            from copy import deepcopy
+            pub = deepcopy(ann_msg.embeds[0])
+            pub.title = (pub.title or "1v1") + " — CANCELLED"
+            pub.set_footer(text=f"Cancelled by {actor.display_name if actor else 'admin'}")
+            await ann_msg.edit(content="**⛔ This match was CANCELLED by admin.**", embed=pub)
+        else:
+            await ann_msg.edit(content="**⛔ This match was CANCELLED by admin.**")
 
-    # 4) Clean up private text/voice/category if any
-    for key in ("text_chan_id", "text_channel_id", "private_text_channel_id", "match_text_channel_id", "channel_id"):
-        try:
-            ch_id = match.get(key)
-            if ch_id:
-                ch = guild.get_channel(ch_id)
-                if isinstance(ch, (discord.TextChannel, discord.Thread)):
-                    await ch.delete(reason="1v1 cancelled")
-        except Exception:
-            pass
+    # best-effort: one failing step doesn't stop the others
+    await asyncio.gather(_admin_card(), _rooms(), _announce_card(), return_exceptions=True)
+    METRICS.inc("matches_cancelled")
 
-    for key in ("voice_chan_id", "voice_channel_id", "temp_voice_channel_id", "voice_id"):
-        try:
-            vc_id = match.get(key)
-            if vc_id:
-                vc = guild.get_channel(vc_id)
-                if isinstance(vc, discord.VoiceChannel):
-                    await vc.delete(reason="1v1 cancelled")
-        except Exception:
-            pass
+    # 4) Remove from registry (memory + indexes + persisted record) and its timeout
+    _unregister_match(admin_msg_id)
+    await SCHEDULER.cancel("match_timeout", admin_msg_id)
+    await _forget_match(admin_msg_id)
 
-    try:
-        cat_id = match.get("category_id")
-        if cat_id:
-            cat = guild.get_channel(cat_id)
-            if isinstance(cat, discord.CategoryChannel):
-                await cat.delete(reason="1v1 cancelled")
-    except Exception:
-        pass
+    return True
 
-    # 5) Remove from registry
-    try:
-        MATCHES.pop(admin_msg_id, None)
-    except Exception:
-        pass
 
-    return True
+async def cancel_matches(guild: discord.Guild, admin_msg_ids: list[int], reason: str, actor: discord.Member | None = None) -> int:
+    """Cancel many matches in one pass, at most CANCEL_CONCURRENCY at a time; returns how many were cancelled."""
+    sem = asyncio.Semaphore(CANCEL_CONCURRENCY)
+
+    async def _one(mid: int) -> bool:
+        async with sem:
+            try:
+                return await cancel_match(guild, mid, reason=reason, actor=actor)
+            except Exception as e:
+                print(f"[Bot2] Bulk cancel of match {mid} failed: {e}")
+                return False
+
+    results = await asyncio.gather(*(_one(mid) for mid in admin_msg_ids))
+    return sum(1 for ok in results if ok)
+
+
+def live_matches(guild_id: int, older_than_s: float = 0) -> list[int]:
+    """Unresolved matches in a guild that started at least older_than_s seconds ago."""
+    cutoff = time.time() - older_than_s
+    return [
+        mid for mid, m in MATCHES.items()
+        if m.get("guild_id") == guild_id and not m.get("resolved") and _match_started_at(m) <= cutoff
+    ]
+
+
+def _match_started_at(match: dict) -> float:
+    return match["started_at"]
+
+
+def _room_category(guild: discord.Guild, base_channel: Optional[discord.abc.GuildChannel] = None):
+    category = guild.get_channel(ONEVONE_CATEGORY_ID) if ONEVONE_CATEGORY_ID else None
+    if category is None and hasattr(base_channel, "category"):
+        category = base_channel.category
+    return category
+
+
+def _room_overwrites(guild: discord.Guild, *players: discord.Member, admins: bool = True) -> dict:
+    """Room permissions: hidden from everyone except the given players, the bot, and (optionally) admins."""
+    overwrites = {
+        guild.default_role: discord.PermissionOverwrite(view_channel=False),
+
+        guild.me: discord.PermissionOverwrite(
+            view_channel=True, send_messages=True, manage_channels=True, manage_messages=True, connect=True, speak=True
+        ),
+    }
+    for player in players:
+        overwrites[player] = discord.PermissionOverwrite(
+            view_channel=True, send_messages=True, read_message_history=True, connect=True, speak=True
+        )
 
+    # Optional admin role visibility
+    admin_role = guild.get_role(ADMIN_ROLE_ID) if admins and 'ADMIN_ROLE_ID' in globals() else None
+    if admin_role:
+        overwrites[admin_role] = discord.PermissionOverwrite(
+            view_channel=True, read_message_history=True, send_messages=True, connect=True, speak=True
+        )
+    return overwrites
 
 
 async def create_1v1_rooms(
@@ -254,48 +295,44 @@ async def create_1v1_rooms(
     player2: discord.Member,
     base_channel: discord.abc.GuildChannel
 ) -> Tuple[Optional[int], Optional[int]]:
-    """Create a private text + voice channel visible only to p1, p2, bot, and admins."""
-    try:
-        category = guild.get_channel(ONEVONE_CATEGORY_ID) if ONEVONE_CATEGORY_ID else None
-        if category is None and hasattr(base_channel, "category"):
-            category = base_channel.category
+    """Create (or lease from the warm pool) a private text + voice channel visible only to p1, p2, bot, and admins."""
+    overwrites = _room_overwrites(guild, player1, player2)
+    safe_name = f"{player1.display_name}-vs-{player2.display_name}".replace(" ", "-")[:90]
 
-        overwrites = {
-            guild.default_role: discord.PermissionOverwrite(view_channel=False),
+    if ROOM_POOL_SIZE:
+        leased = await _lease_pool_rooms(guild, safe_name, overwrites)
+        if leased:
+            return leased
 
-            player1: discord.PermissionOverwrite(
-                view_channel=True, send_messages=True, read_message_history=True, connect=True, speak=True
-            ),
-            player2: discord.PermissionOverwrite(
-                view_channel=True, send_messages=True, read_message_history=True, connect=True, speak=True
+    try:
+        category = _room_category(guild, base_channel)
+
+        # Text and voice rooms don't depend on each other: create both at once
+        text_chan, voice_chan = await asyncio.gather(
+            guild.create_text_channel(
+                name=safe_name,
+                overwrites=overwrites,
+                category=category,
+                reason="1v1 match room (text)"
             ),
-
-            guild.me: discord.PermissionOverwrite(
-                view_channel=True, send_messages=True, manage_channels=True, manage_messages=True, connect=True, speak=True
+            guild.create_voice_channel(
+                name=f"VC-{safe_name}",
+                overwrites=overwrites,
+                category=category,
+                reason="1v1 match room (voice)"
             ),
-        }
-
-        # Optional admin role visibility
-        admin_role = guild.get_role(ADMIN_ROLE_ID) if 'ADMIN_ROLE_ID' in globals() else None
-        if admin_role:
-            overwrites[admin_role] = discord.PermissionOverwrite(
-                view_channel=True, read_message_history=True, send_messages=True, connect=True, speak=True
-            )
-
-        safe_name = f"{player1.display_name}-vs-{player2.display_name}".replace(" ", "-")[:90]
-
-        text_chan = await guild.create_text_channel(
-            name=safe_name,
-            overwrites=overwrites,
-            category=category,
-            reason="1v1 match room (text)"
-        )
-        voice_chan = await guild.create_voice_channel(
-            name=f"VC-{safe_name}",
-            overwrites=overwrites,
-            category=category,
-            reason="1v1 match room (voice)"
+            return_exceptions=True,
         )
+        failed = next((r for r in (text_chan, voice_chan) if isinstance(r, BaseException)), None)
+        if failed is not None:
+            # don't leave half a room pair behind
+            for chan in (text_chan, voice_chan):
+                if not isinstance(chan, BaseException):
+                    try:
+                        await chan.delete(reason="1v1 room creation failed")
+                    except discord.HTTPException:
+                        pass
+            raise failed
 
         return text_chan.id, voice_chan.id
 
@@ -308,152 +345,553 @@ async def create_1v1_rooms(
 
 
 async def cleanup_1v1_rooms(guild: discord.Guild, text_id: Optional[int], voice_id: Optional[int], delay_seconds: int = 180):
-    """Delete the given text/voice channels after a delay."""
+    """Release the given text/voice channels after a delay (back to the pool, or deleted)."""
     await asyncio.sleep(delay_seconds)
-    for chan_id in (text_id, voice_id):
-        if chan_id:
-            chan = guild.get_channel(chan_id)
-            if chan:
-                try:
-                    await chan.delete(reason="1v1 match finished (auto-cleanup)")
-                except discord.HTTPException:
-                    pass
+    await _release_rooms(guild, text_id, voice_id, reason="1v1 match finished (auto-cleanup)")
+
+
+# ---------- Warm room pool ----------
+# With ROOM_POOL_SIZE > 0, hidden text/voice pairs are pre-created under ONEVONE_CATEGORY_ID.
+# A match leases one by renaming it and swapping overwrites; when it's done the text
+# history is purged and the overwrites go back to hidden. Pool rooms carry the text-channel
+# topic "1v1-pool:<voice_id>", which is how they're recognised on release and after a restart.
+# Release doesn't rename: Discord allows ~2 renames per channel per 10 minutes, so each
+# lease/release cycle spends only one, and a lease that gets throttled anyway falls back
+# to creating fresh rooms after ROOM_POOL_LEASE_TIMEOUT_S.
+
+def _pool_topic(voice_id: int) -> str:
+    return f"{ROOM_POOL_TOPIC_PREFIX}{voice_id}"
+
+
+def _pool_voice_id(text_chan) -> Optional[int]:
+    topic = getattr(text_chan, "topic", None) or ""
+    if not topic.startswith(ROOM_POOL_TOPIC_PREFIX):
+        return None
+    try:
+        return int(topic[len(ROOM_POOL_TOPIC_PREFIX):])
+    except ValueError:
+        return None
+
+
+async def _lease_pool_rooms(guild: discord.Guild, name: str, overwrites: dict) -> Optional[Tuple[int, int]]:
+    idle = ROOM_POOL.get(guild.id)
+    lease = None
+    while idle:
+        text_id, voice_id = idle.popleft()
+        text_chan, voice_chan = guild.get_channel(text_id), guild.get_channel(voice_id)
+        if text_chan and voice_chan:
+            lease = (text_chan, voice_chan)
+            break
+    _spawn_pool_refill(guild)
+    if lease is None:
+        return None
 
+    text_chan, voice_chan = lease
+    try:
+        await asyncio.wait_for(asyncio.gather(
+            text_chan.edit(name=name, overwrites=overwrites, reason="1v1 match room (pooled text)"),
+            voice_chan.edit(name=f"VC-{name}", overwrites=overwrites, reason="1v1 match room (pooled voice)"),
+        ), timeout=ROOM_POOL_LEASE_TIMEOUT_S)
+    except (discord.HTTPException, asyncio.TimeoutError) as e:
+        print(f"[1v1] Could not lease pooled rooms: {e}")
+        await _release_rooms(guild, text_chan.id, voice_chan.id, reason="1v1 pooled lease failed")
+        return None
+    return text_chan.id, voice_chan.id
+
+
+def _pool_room_leased(text_chan: discord.TextChannel) -> bool:
+    """A pooled room is leased while it carries overwrites for anyone other than roles and the bot."""
+    me = text_chan.guild.me
+    return any(not isinstance(target, discord.Role) and target.id != me.id for target in text_chan.overwrites)
+
+
+async def _reset_pool_rooms(guild: discord.Guild, text_chan: discord.TextChannel, voice_chan: discord.VoiceChannel):
+    """Hide an idle pair again, purge its chat, and drop anyone still in voice."""
+    hidden = _room_overwrites(guild, admins=False)
+    await asyncio.gather(
+        text_chan.edit(overwrites=hidden, reason="1v1 room returned to pool"),
+        voice_chan.edit(overwrites=hidden, reason="1v1 room returned to pool"),
+    )
+    for member in list(voice_chan.members):
+        try:
+            await member.move_to(None, reason="1v1 room returned to pool")
+        except discord.HTTPException:
+            pass
+    await text_chan.purge(limit=None, reason="1v1 room returned to pool")
+
+
+async def _release_rooms(guild: discord.Guild, text_id: Optional[int], voice_id: Optional[int], reason: str):
+    """Give a match's rooms back: pooled pairs are recycled while the pool has room, anything else is deleted."""
+    text_chan = guild.get_channel(text_id) if text_id else None
+    voice_chan = guild.get_channel(voice_id) if voice_id else None
+
+    if (ROOM_POOL_SIZE and text_chan and voice_chan
+            and _pool_voice_id(text_chan) == voice_chan.id
+            and len(ROOM_POOL.get(guild.id, ())) < ROOM_POOL_SIZE):
+        try:
+            await _reset_pool_rooms(guild, text_chan, voice_chan)
+            ROOM_POOL.setdefault(guild.id, deque()).append((text_chan.id, voice_chan.id))
+            return
+        except discord.HTTPException as e:
+            print(f"[1v1] Could not recycle pooled rooms, deleting instead: {e}")
+
+    for chan in (text_chan, voice_chan):
+        if chan:
+            try:
+                await chan.delete(reason=reason)
+            except discord.HTTPException:
+                pass
+
+
+def _spawn_pool_refill(guild: discord.Guild):
+    if ROOM_POOL_SIZE and guild.id not in _POOL_REFILLING:
+        _POOL_REFILLING.add(guild.id)
+        asyncio.create_task(_refill_room_pool(guild))
+
+
+async def _refill_room_pool(guild: discord.Guild):
+    """Create idle pairs one at a time until the pool is full (gentle on the channel-create limit)."""
+    try:
+        category = _room_category(guild)
+        hidden = _room_overwrites(guild, admins=False)
+        idle = ROOM_POOL.setdefault(guild.id, deque())
+        while len(idle) < ROOM_POOL_SIZE:
+            voice_chan = await guild.create_voice_channel(
+                name=f"VC-{ROOM_POOL_IDLE_NAME}", overwrites=hidden, category=category,
+                reason="1v1 room pool (voice)"
+            )
+            try:
+                text_chan = await guild.create_text_channel(
+                    name=ROOM_POOL_IDLE_NAME, overwrites=hidden, category=category,
+                    topic=_pool_topic(voice_chan.id), reason="1v1 room pool (text)"
+                )
+            except discord.HTTPException:
+                await voice_chan.delete(reason="1v1 room pool creation failed")
+                raise
+            idle.append((text_chan.id, voice_chan.id))
+    except discord.HTTPException as e:
+        print(f"[1v1] Room pool refill stopped: {e}")
+    finally:
+        _POOL_REFILLING.discard(guild.id)
 
-async def arm_match_timeout(guild: discord.Guild, match_id: int, timeout_min: int = 90):
-    """Safety net: remove 1v1 rooms if the match never gets confirmed."""
-    await asyncio.sleep(timeout_min * 60)
+
+async def load_room_pool(guild: discord.Guild):
+    """After a restart: adopt existing pool rooms that no live match or pending cleanup owns, then top up."""
+    if not ROOM_POOL_SIZE:
+        return
+    category = _room_category(guild)
+    if category is None:
+        return
+    in_use = {m.get("text_chan_id") for m in MATCHES.values()}
+    idle = ROOM_POOL.setdefault(guild.id, deque())
+    known = {t for t, _v in idle}
+    for text_chan in category.text_channels:
+        voice_id = _pool_voice_id(text_chan)
+        voice_chan = guild.get_channel(voice_id) if voice_id else None
+        if (voice_chan is None or text_chan.id in in_use or text_chan.id in known
+                or SCHEDULER.pending("room_cleanup", text_chan.id) is not None):
+            continue
+        if _pool_room_leased(text_chan):
+            # leased when the bot went down: still has players' overwrites/history
+            await _release_rooms(guild, text_chan.id, voice_chan.id, reason="1v1 orphaned pooled room")
+        elif len(idle) < ROOM_POOL_SIZE:
+            idle.append((text_chan.id, voice_chan.id))
+    _spawn_pool_refill(guild)
+
+
+# Older match records named their rooms differently; fold those into text_chan_id / voice_chan_id
+_ROOM_KEY_ALIASES = {
+    "text_chan_id": ("text_channel_id", "private_text_channel_id", "match_text_channel_id", "channel_id"),
+    "voice_chan_id": ("voice_channel_id", "temp_voice_channel_id", "voice_id"),
+}
+
+
+def _normalize_room_keys(match: dict) -> dict:
+    for key, aliases in _ROOM_KEY_ALIASES.items():
+        for alias in aliases:
+            val = match.pop(alias, None)
+            if val and not match.get(key):
+                match[key] = val
+        match.setdefault(key, None)
+    return match
+
+
+def _register_match(admin_msg_id: int, match: dict):
+    """Add a live match to MATCHES and its per-player / per-pair indexes."""
+    MATCHES[admin_msg_id] = _normalize_room_keys(match)
+    MATCH_BY_USER[match["a"]] = admin_msg_id
+    MATCH_BY_USER[match["b"]] = admin_msg_id
+    MATCH_BY_PAIR[frozenset((match["a"], match["b"]))] = admin_msg_id
+
+
+def _unregister_match(admin_msg_id: int) -> dict | None:
+    """Evict a match from MATCHES and both indexes; returns the evicted entry."""
+    match = MATCHES.pop(admin_msg_id, None)
+    if match is None:
+        return None
+    for uid in (match.get("a"), match.get("b")):
+        if MATCH_BY_USER.get(uid) == admin_msg_id:
+            MATCH_BY_USER.pop(uid, None)
+    pair = frozenset((match.get("a"), match.get("b")))
+    if MATCH_BY_PAIR.get(pair) == admin_msg_id:
+        MATCH_BY_PAIR.pop(pair, None)
+    return match
+
+
+def active_match_for(user_id: int) -> int | None:
+    """Admin message id of the user's live match, if any (O(1))."""
+    return MATCH_BY_USER.get(user_id)
+
+
+def active_match_between(a_id: int, b_id: int) -> int | None:
+    return MATCH_BY_PAIR.get(frozenset((a_id, b_id)))
+
+
+def player_busy(user_id: int) -> bool:
+    """True if the user is in a live match or one is being set up for them right now."""
+    return user_id in MATCH_BY_USER or user_id in _STARTING_USERS
+
+
+async def arm_match_timeout(guild: discord.Guild, match_id: int, deadline: float):
+    """Safety net: remove 1v1 rooms at `deadline` (unix time) if the match never gets confirmed."""
+    await SCHEDULER.schedule("match_timeout", match_id, deadline, {"guild_id": guild.id})
+
+
+async def _on_match_timeout(match_id: int, payload: dict):
+    guild = bot2.get_guild(payload.get("guild_id"))
     match = MATCHES.get(match_id)
-    if match and not match.get("resolved"):
-        await cleanup_1v1_rooms(guild, match.get("text_chan_id"), match.get("voice_chan_id"), delay_seconds=0)
+    if guild and match and not match.get("resolved"):
+        # claim it before the first await so a late confirm can't record a result mid-cleanup
+        match["resolved"] = True
         match["timed_out"] = True
+        _unregister_match(match_id)
+        METRICS.inc("matches_timed_out")
+        await cleanup_1v1_rooms(guild, match.get("text_chan_id"), match.get("voice_chan_id"), delay_seconds=0)
+        await _mark_admin_card_timed_out(guild, match_id)
+        await _forget_match(match_id)
 
 
-def load_color_message_id_from_db(guild_id: int):
+async def _mark_admin_card_timed_out(guild: discord.Guild, admin_msg_id: int):
+    """The match can no longer be confirmed: say so on the admin card and drop its buttons."""
+    admin_chan = guild.get_channel(WIN_REPORT_CHANNEL_ID)
+    if not isinstance(admin_chan, (discord.TextChannel, discord.Thread)):
+        return
+    try:
+        admin_msg = await admin_chan.fetch_message(admin_msg_id)
+        new_content = f"~~{admin_msg.content}~~\n**⏲️ Match TIMED OUT** — no result was confirmed in time; it can no longer be confirmed."
+        if admin_msg.embeds:
+            from copy import deepcopy
+            emb = deepcopy(admin_msg.embeds[0])
+            emb.title = (emb.title or "Match") + " — TIMED OUT"
+            await admin_msg.edit(content=new_content, embed=emb)
+        else:
+            await admin_msg.edit(content=new_content)
+        await admin_msg.clear_reactions()
+    except Exception as e:
+        print(f"[Bot2] Could not mark admin card {admin_msg_id} as timed out: {e}")
+
+
+async def schedule_room_cleanup(guild: discord.Guild, text_id: Optional[int], voice_id: Optional[int], delay_seconds: int = 180):
+    """Delete a finished match's rooms after a delay (persisted, survives restarts)."""
+    key = text_id or voice_id
+    if not key:
+        return
+    await SCHEDULER.schedule(
+        "room_cleanup", key, time.time() + delay_seconds,
+        {"guild_id": guild.id, "text_id": text_id, "voice_id": voice_id}
+    )
+
+
+async def _on_room_cleanup(_key: int, payload: dict):
+    guild = bot2.get_guild(payload.get("guild_id"))
+    if guild:
+        await cleanup_1v1_rooms(guild, payload.get("text_id"), payload.get("voice_id"), delay_seconds=0)
+
+
+async def _persist_match(admin_msg_id: int):
+    """Write-ahead: mirror the MATCHES entry to active_matches (best-effort)."""
+    match = MATCHES.get(admin_msg_id)
+    if not match:
+        return
+    try:
+        await db_write(save_active_match, admin_msg_id, match)
+    except Exception as e:
+        print(f"[Bot2] Could not persist match {admin_msg_id}: {e}")
+
+
+async def _forget_match(admin_msg_id: int):
+    """Drop the persisted record once a match is confirmed, cancelled or timed out."""
+    try:
+        await db_write(delete_active_match, admin_msg_id)
+    except Exception as e:
+        print(f"[Bot2] Could not delete persisted match {admin_msg_id}: {e}")
+
+
+async def restore_active_matches():
+    """Bulk-load persisted in-flight matches into MATCHES and re-arm their safety timeouts."""
+    saved = await db_read(load_active_matches)
+    restored = 0
+    for admin_msg_id, match in saved.items():
+        if admin_msg_id in MATCHES:
+            continue
+        guild = bot2.get_guild(match["guild_id"])
+        if guild is None:
+            continue
+        _register_match(admin_msg_id, match)
+        await arm_match_timeout(guild, admin_msg_id, match["deadline"])
+        restored += 1
+    if restored:
+        print(f"[Bot2] Restored {restored} in-flight 1v1 match(es).")
+
+
+async def load_color_message_id_from_db(guild_id: int):
     global MESSAGE_ID
-    saved = get_setting(guild_id, COLOR_MSG_KEY)
+    saved = await db_read(get_setting, guild_id, COLOR_MSG_KEY)
     MESSAGE_ID = int(saved) if saved and saved.isdigit() else None
 
 
-async def save_leaderboard_message_id(msg_id: int, guild_id: int):
+async def save_leaderboard_message_id(msg_id: int, guild_id: int, digest: str | None = None):
     global LEADERBOARD_MESSAGE_ID
     LEADERBOARD_MESSAGE_ID = msg_id
-    set_setting(guild_id, LB_KEY, str(int(msg_id)))
+    await db_write(set_setting, guild_id, LB_KEY, str(int(msg_id)))
+    if digest:
+        _LB_POSTED_DIGEST[guild_id] = digest
+        await db_write(set_setting, guild_id, LB_DIGEST_KEY, digest)
+
+# ---------- HTTP session + avatar cache ----------
+# One pooled session for the bot's lifetime (created lazily, closed in main()).
+_HTTP_SESSION: aiohttp.ClientSession | None = None
+
+AVATAR_CACHE_MAX = 256   # decoded + circle-cropped avatars kept in memory (LRU)
+AVATAR_CACHE_DIR = None  # e.g. "avatar_cache" to also keep raw avatar bytes on disk across restarts
+# (avatar hash, size) -> cropped RGBA image. Avatar hashes change whenever the picture
+# changes, so a hit never needs revalidating against the CDN.
+_AVATAR_CACHE: "OrderedDict[tuple[str, int], Image.Image]" = OrderedDict()
+
+
+def _http_session() -> aiohttp.ClientSession:
+    global _HTTP_SESSION
+    if _HTTP_SESSION is None or _HTTP_SESSION.closed:
+        _HTTP_SESSION = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=16, ttl_dns_cache=300),
+            timeout=aiohttp.ClientTimeout(total=15),
+        )
+    return _HTTP_SESSION
+
+
+async def close_http_session():
+    global _HTTP_SESSION
+    if _HTTP_SESSION is not None and not _HTTP_SESSION.closed:
+        await _HTTP_SESSION.close()
+    _HTTP_SESSION = None
+
 
 async def _fetch_bytes(url: str) -> bytes:
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as r:
-            r.raise_for_status()
-            return await r.read()
+    async with _http_session().get(url) as r:
+        r.raise_for_status()
+        return await r.read()
+
+
+def _avatar_disk_path(avatar_key: str) -> str | None:
+    if not AVATAR_CACHE_DIR:
+        return None
+    safe = re.sub(r"[^A-Za-z0-9_]", "", avatar_key)
+    return os.path.join(AVATAR_CACHE_DIR, f"{safe}.img") if safe else None
+
+
+def _read_avatar_disk(avatar_key: str) -> bytes | None:
+    path = _avatar_disk_path(avatar_key)
+    if not path:
+        return None
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _write_avatar_disk(avatar_key: str, data: bytes):
+    path = _avatar_disk_path(avatar_key)
+    if not path:
+        return
+    try:
+        os.makedirs(AVATAR_CACHE_DIR, exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+    except OSError as e:
+        print(f"[Bot2] Could not write avatar cache {path}: {e}")
+
+
+def _decode_avatar(raw: bytes, size: int) -> Image.Image:
+    return _circle_crop(Image.open(io.BytesIO(raw)), size)
+
+
+async def _get_avatar(member: discord.Member, size: int) -> Image.Image | None:
+    """Circle-cropped avatar for `member`, served from the LRU/disk cache when possible."""
+    asset = member.display_avatar
+    key = (asset.key, size)
+    img = _AVATAR_CACHE.get(key)
+    if img is not None:
+        _AVATAR_CACHE.move_to_end(key)
+        return img
+
+    raw = await asyncio.to_thread(_read_avatar_disk, asset.key)
+    if raw is None:
+        raw = await _fetch_bytes(str(asset.replace(size=128).url))
+        if not raw:
+            return None
+        await asyncio.to_thread(_write_avatar_disk, asset.key, raw)
+
+    loop = asyncio.get_running_loop()
+    img = await loop.run_in_executor(_RENDER_POOL, _decode_avatar, raw, size)
+    _AVATAR_CACHE[key] = img
+    while len(_AVATAR_CACHE) > AVATAR_CACHE_MAX:
+        _AVATAR_CACHE.popitem(last=False)
+    return img
+
+# Pillow work (text layout, LANCZOS resizes, PNG encode) runs here, never on the gateway loop.
+# Threads rather than processes: Pillow releases the GIL for the heavy parts and the
+# prefetched avatar images don't need pickling. One thread, because the memoized
+# fonts and templates below are shared objects.
+RENDER_THREADS = 1
+_RENDER_POOL = ThreadPoolExecutor(max_workers=RENDER_THREADS, thread_name_prefix="bot2-render")
+LB_AVATAR_SIZE = 72
+
 
 # DROP-IN REPLACEMENT (same signature)
-async def render_leaderboard_image(rows, guild) -> io.BytesIO:
+async def render_leaderboard_image(rows, guild, members: dict | None = None) -> io.BytesIO:
     """
     rows: [{'user_id': int, 'points': int, 'wins': int, 'losses': int, 'streak': int}, ...]
     guild: discord.Guild
+    members: optional {user_id: Member|None} already resolved by the caller
     """
-    # Layout
-    pad_x = 32
-    pad_y = 24
-    row_h = 92
-    avatar_size = 72
-    col_rank_w = 80
-    col_name_w = 480
-    col_points_w = 160
-    col_wins_w = 140
-    col_losses_w = 160
-    col_streak_w = 160
-    col_rankname_w = 200  # width for Rank (Elite/Pro/Master/Grand Master/Legendary)
-
-    width = (
-        pad_x*2
-        + col_rank_w + col_name_w + col_points_w + col_wins_w
-        + col_losses_w + col_streak_w + col_rankname_w
-    )
-    height = pad_y*2 + row_h*(len(rows)+1)  # + header row
+    # Gather every network input up front (concurrently), then draw in the render pool.
+    if members is None:
+        members = await _resolve_leaderboard_members(rows, guild)
+    avatars = await _prefetch_avatars(members, LB_AVATAR_SIZE)
+
+    entries = []
+    for r in rows:
+        member = members.get(r["user_id"])  # None if they left the server
+        entries.append({
+            **r,
+            "display_name": (member.display_name if member else f"Left server ({r['user_id']})"),
+            "global_name": (getattr(member, "global_name", None) if member else None),
+            "avatar": avatars.get(r["user_id"]),
+        })
+
+    loop = asyncio.get_running_loop()
+    png = await loop.run_in_executor(_RENDER_POOL, _draw_leaderboard_png, entries)
+    return io.BytesIO(png)
+
+
+
+# Static layout (shared by the template and the per-render dynamic cells)
+_LB_PAD_X = 32
+_LB_PAD_Y = 24
+_LB_ROW_H = 92
+_LB_COL_W = {
+    "rank": 80,
+    "name": 480,
+    "points": 160,
+    "wins": 140,
+    "losses": 160,
+    "streak": 160,
+    "rankname": 200,  # width for Rank (Elite/Pro/Master/Grand Master/Legendary)
+}
+_LB_COL_X = {}
+_x = _LB_PAD_X
+for _col, _w in _LB_COL_W.items():
+    _LB_COL_X[_col] = _x
+    _x += _w
+_LB_WIDTH = _x + _LB_PAD_X
+del _x, _col, _w
+
+LEADERBOARD_TEMPLATE_ROWS = (10, 25, 50)  # pre-rendered at startup; other sizes on first use
+
+
+@functools.lru_cache(maxsize=8)
+def _leaderboard_template(n_rows: int) -> Image.Image:
+    """Background, header bar, column titles and zebra stripes for `n_rows` rows. Copy before drawing."""
+    pad_x, row_h = _LB_PAD_X, _LB_ROW_H
+    width = _LB_WIDTH
+    height = _LB_PAD_Y*2 + row_h*(n_rows+1)  # + header row
 
     bg = Image.new("RGBA", (width, height), (18, 18, 20, 255))
     draw = ImageDraw.Draw(bg)
     font_header = _load_font(30)
-    font = _load_font(26)
-    font_small = _load_font(22)
 
     # Header bar
-    header_y = pad_y
+    header_y = _LB_PAD_Y
     draw.rounded_rectangle(
         (pad_x, header_y, width - pad_x, header_y + row_h),
         radius=18, fill=(35, 35, 40, 255)
     )
 
     # Column titles
-    def col_title(x_start, label):
-        draw.text((x_start+12, header_y + row_h/2), label, font=font_header,
+    for col, label in (("rank", "#"), ("name", "Player"), ("points", "Points"), ("wins", "Wins"),
+                       ("losses", "Losses"), ("streak", "Streak"), ("rankname", "Rank")):
+        draw.text((_LB_COL_X[col]+12, header_y + row_h/2), label, font=font_header,
                   fill=(235, 235, 240, 255), anchor="lm")
 
-    col_x = {
-        "rank":     pad_x,
-        "name":     pad_x + col_rank_w,
-        "points":   pad_x + col_rank_w + col_name_w,
-        "wins":     pad_x + col_rank_w + col_name_w + col_points_w,
-        "losses":   pad_x + col_rank_w + col_name_w + col_points_w + col_wins_w,
-        "streak":   pad_x + col_rank_w + col_name_w + col_points_w + col_wins_w + col_losses_w,
-        "rankname": pad_x + col_rank_w + col_name_w + col_points_w + col_wins_w + col_losses_w + col_streak_w,
-    }
-    col_title(col_x["rank"],   "#")
-    col_title(col_x["name"],   "Player")
-    col_title(col_x["points"], "Points")
-    col_title(col_x["wins"],   "Wins")
-    col_title(col_x["losses"], "Losses")
-    col_title(col_x["streak"], "Streak")
-    col_title(col_x["rankname"], "Rank")
-
-    # Rows
+    # zebra stripes on even rows
     y = header_y + row_h
-    for i, r in enumerate(rows, start=1):
-        # zebra
+    for i in range(1, n_rows + 1):
         if i % 2 == 0:
             draw.rounded_rectangle((pad_x, y, width - pad_x, y + row_h),
                                    radius=16, fill=(28, 28, 32, 255))
+        y += row_h
+    return bg
 
-        # rank #
-        draw.text((col_x["rank"] + 22, y + row_h/2), str(i), font=font,
-                  fill=(220, 220, 230, 255), anchor="lm")
 
-        # --- SAFE MEMBER LOOKUP (no crashes if user left) ---
-        member = guild.get_member(r["user_id"])
-        if member is None:
-            try:
-                member = await guild.fetch_member(r["user_id"])
-            except Exception:
-                member = None  # covers discord.NotFound (10007) and HTTP issues
+def _warm_leaderboard_templates():
+    for size in (22, 26, 30):
+        _load_font(size)
+    for n in LEADERBOARD_TEMPLATE_ROWS:
+        _leaderboard_template(n)
 
-        display_name = (member.display_name if member else f"Left server ({r['user_id']})")
 
-        # avatar (best-effort; ignore failures)
-        avatar_img = None
-        try:
-            if member:
-                avatar_url = str(member.display_avatar.replace(size=128).url)
-                avatar_bytes = await _fetch_bytes(avatar_url)
-                if avatar_bytes:
-                    avatar_img = Image.open(io.BytesIO(avatar_bytes))
-                    avatar_img = _circle_crop(avatar_img, avatar_size)
-        except Exception:
-            avatar_img = None
+def _draw_leaderboard_png(entries: list[dict]) -> bytes:
+    """
+    Pure, CPU-only leaderboard renderer (safe to run in a worker thread).
+    entries: rows from leaderboard_top() plus 'display_name', 'global_name', 'avatar' (cropped Image|None)
+    Only the per-row cells are drawn; the static parts come from _leaderboard_template().
+    """
+    row_h = _LB_ROW_H
+    avatar_size = LB_AVATAR_SIZE
+    col_x = _LB_COL_X
+    col_points_w = _LB_COL_W["points"]
+    col_wins_w = _LB_COL_W["wins"]
+    col_losses_w = _LB_COL_W["losses"]
+    col_streak_w = _LB_COL_W["streak"]
+    col_rankname_w = _LB_COL_W["rankname"]
+
+    bg = _leaderboard_template(len(entries)).copy()
+    draw = ImageDraw.Draw(bg)
+    font = _load_font(26)
+    font_small = _load_font(22)
+
+    # Rows
+    y = _LB_PAD_Y + row_h
+    for i, r in enumerate(entries, start=1):
+        # rank #
+        draw.text((col_x["rank"] + 22, y + row_h/2), str(i), font=font,
+                  fill=(220, 220, 230, 255), anchor="lm")
 
         name_x   = col_x["name"] + avatar_size + 18
         avatar_x = col_x["name"] + 8
         avatar_y = int(y + (row_h - avatar_size)/2)
+        avatar_img = r.get("avatar")
         if avatar_img:
             bg.paste(avatar_img, (avatar_x, avatar_y), avatar_img)
 
         # primary name line
-        draw.text((name_x, y + row_h/2 - 12), display_name, font=font,
+        draw.text((name_x, y + row_h/2 - 12), r["display_name"], font=font,
                   fill=(240, 240, 245, 255), anchor="lm")
 
         # secondary tag
-        if member and getattr(member, "global_name", None):
-            draw.text((name_x, y + row_h/2 + 18), f"@{member.global_name}", font=font_small,
+        if r.get("global_name"):
+            draw.text((name_x, y + row_h/2 + 18), f"@{r['global_name']}", font=font_small,
                       fill=(170, 170, 180, 255), anchor="lm")
 
         # numeric columns helper
@@ -475,8 +913,7 @@ async def render_leaderboard_image(rows, guild) -> io.BytesIO:
 
     buf = io.BytesIO()
     bg.save(buf, "PNG")
-    buf.seek(0)
-    return buf
+    return buf.getvalue()
 
 # --- ADD: safe member fetch everywhere ---
 async def get_member_safe(guild: discord.Guild, user_id: int) -> discord.Member | None:
@@ -489,47 +926,137 @@ async def get_member_safe(guild: discord.Guild, user_id: int) -> discord.Member
         return None  # covers NotFound (10007) + HTTP issues
 
 
-# put near your other helpers
-async def build_leaderboard_embed_and_file(guild, limit: int = 10):
-    rows = get_top_rows(limit)
+# Last rendered PNG per guild: guild_id -> (digest, png bytes)
+_LB_IMAGE_CACHE: dict[int, tuple[str, bytes]] = {}
+# Digest of the image currently posted in the leaderboard channel: guild_id -> digest
+_LB_POSTED_DIGEST: dict[int, str] = {}
+
+
+LB_FETCH_CONCURRENCY = 5   # parallel member/avatar fetches per render
+LB_FETCH_TIMEOUT_S = 5.0   # give up on a single slow fetch (row renders without it)
+
+
+async def _gather_bounded(keys, fetch, default=None) -> dict:
+    """Run fetch(key) for every key concurrently (bounded + per-call timeout); failures → default."""
+    sem = asyncio.Semaphore(LB_FETCH_CONCURRENCY)
+
+    async def one(key):
+        async with sem:
+            try:
+                return key, await asyncio.wait_for(fetch(key), timeout=LB_FETCH_TIMEOUT_S)
+            except Exception:
+                return key, default
+
+    return dict(await asyncio.gather(*(one(k) for k in keys)))
+
+
+async def _resolve_leaderboard_members(rows, guild) -> dict[int, discord.Member | None]:
+    return await _gather_bounded([r["user_id"] for r in rows], lambda uid: get_member_safe(guild, uid))
+
+
+async def _prefetch_avatars(members: dict, size: int) -> dict[int, Image.Image | None]:
+    present = [uid for uid, m in members.items() if m]
+    return await _gather_bounded(present, lambda uid: _get_avatar(members[uid], size))
+
+
+def _leaderboard_digest(rows, members) -> str:
+    """Hash of everything that ends up in the image: stats, names and avatar hashes."""
+    h = hashlib.sha256()
+    for r in rows:
+        m = members.get(r["user_id"])
+        h.update(repr((
+            r["user_id"], r.get("points", 0), r.get("wins", 0), r.get("losses", 0), r.get("streak", 0),
+            m.display_name if m else None,
+            getattr(m, "global_name", None) if m else None,
+            m.display_avatar.key if m else None,
+        )).encode())
+    return h.hexdigest()
+
+
+async def leaderboard_png(guild, limit: int = 10) -> tuple[str | None, bytes | None]:
+    """Return (digest, png) for the current top `limit`; re-renders only when the digest changes."""
+    rows = await leaderboard_top(limit)
     if not rows:
         return None, None
 
-    img_buf = await render_leaderboard_image(rows, guild)
-    file = discord.File(img_buf, filename="leaderboard.png")
+    members = await _resolve_leaderboard_members(rows, guild)
+    digest = _leaderboard_digest(rows, members)
+    cached = _LB_IMAGE_CACHE.get(guild.id)
+    if cached and cached[0] == digest:
+        return cached
+
+    img_buf = await render_leaderboard_image(rows, guild, members=members)
+    png = img_buf.getvalue()
+    _LB_IMAGE_CACHE[guild.id] = (digest, png)
+    return digest, png
+
+
+# put near your other helpers
+async def build_leaderboard_embed_and_file(guild, limit: int = 10):
+    em, file, _digest = await _build_leaderboard_post(guild, limit)
+    return em, file
+
+
+async def _build_leaderboard_post(guild, limit: int = 10):
+    digest, png = await leaderboard_png(guild, limit)
+    if not png:
+        return None, None, None
+
+    file = discord.File(io.BytesIO(png), filename="leaderboard.png")
 
     em = discord.Embed(title="🏆 1v1 Leaderboard", color=discord.Color.blurple())
     em.set_image(url="attachment://leaderboard.png")
     em.set_footer(text="Auto-updates after results are confirmed")
 
-    return em, file
+    return em, file, digest
 
 
 async def refresh_leaderboard_message(guild: discord.Guild):
+    t = time.perf_counter()
+    try:
+        await _refresh_leaderboard_message(guild)
+    except Exception:
+        METRICS.inc("leaderboard_refresh_failures")
+        raise
+    finally:
+        METRICS.observe("leaderboard_refresh_seconds", time.perf_counter() - t)
+
+
+async def _refresh_leaderboard_message(guild: discord.Guild):
     # Use stored channel if set; fall back to constant
-    ch_id = meta_get("leaderboard_channel_id")
+    ch_id = await db_read(meta_get, "leaderboard_channel_id")
     channel_id = int(ch_id) if ch_id and ch_id.isdigit() else LEADERBOARD_CHANNEL_ID
 
     channel = guild.get_channel(channel_id) or await guild.fetch_channel(channel_id)
-    em, file = await build_leaderboard_embed_and_file(guild, limit=10)
+    em, file, digest = await _build_leaderboard_post(guild, limit=10)
     if not em:
         return
 
     # Try to delete old message: use in‑memory ID if set, else read from SQLite
     old_id = LEADERBOARD_MESSAGE_ID
     if not old_id:
-        saved = get_setting(guild.id, LB_KEY)
+        saved = await db_read(get_setting, guild.id, LB_KEY)
         old_id = int(saved) if saved and saved.isdigit() else None
 
+    old = None
     try:
         if old_id:
             old = await channel.fetch_message(old_id)
+    except Exception:
+        old = None
+
+    # Same image already posted → skip the delete + re-upload round trip
+    if old is not None and _LB_POSTED_DIGEST.get(guild.id) == digest:
+        return
+
+    try:
+        if old is not None:
             await old.delete()
     except Exception:
         pass
 
     new_msg = await channel.send(embed=em, file=file)
-    await save_leaderboard_message_id(new_msg.id, guild.id)
+    await save_leaderboard_message_id(new_msg.id, guild.id, digest)
 
 async def _notify_timeout(member: discord.Member):
     try:
@@ -543,59 +1070,188 @@ async def _notify_timeout(member: discord.Member):
 
 
 async def _try_matchmake(guild: discord.Guild):
-    """If at least two users are in queue, pair the first two distinct users and start the SAME flow as challenges."""
-    q = _ensure_queue(guild.id)
+    """Pair queued players according to MM_MODE and start the SAME flow as challenges."""
+    if MM_MODE == "rating":
+        return await _try_matchmake_rating(guild)
 
+    # FIFO: pair the longest-waiting player with the next one they haven't just played
+    q = _ensure_queue(guild.id)
     while len(q) >= 2:
-        uid1, t1 = q.popleft()
-        # ensure uid1 still queued in this guild
-        if MM_INDEX.get(uid1, (None, None))[0] != guild.id:
+        busy: list[int] = []
+        pair = _first_fifo_pair(q, busy)
+        for uid in busy:
+            await _dequeue_user(uid)  # started a match some other way; drop them, keep the rest queued
+        if pair is None:
+            break
+        await _pair_players(guild, *pair)
+        # loop continues to try pairing more players if available
+
+def _first_fifo_pair(q: OrderedDict[int, float], busy: list[int]) -> tuple[int, int] | None:
+    """
+    Earliest pair among the first MM_REMATCH_K + 2 queued players that hasn't just played.
+    A player can exclude at most MM_REMATCH_K opponents, so the head always finds one in that
+    window when the queue is longer; only a queue that fits in the window goes unpaired.
+    Busy players are skipped and collected into `busy` for the caller to dequeue.
+    """
+    window = []
+    for uid in q:
+        if player_busy(uid):
+            busy.append(uid)
             continue
+        window.append(uid)
+        if len(window) == MM_REMATCH_K + 2:
+            break
+    for i, uid1 in enumerate(window):
+        for uid2 in window[i + 1:]:
+            if not recently_played(uid1, uid2):
+                return uid1, uid2
+    return None
 
-        uid2, t2 = None, None
-        while q:
-            cand_uid, cand_t = q.popleft()
-            if cand_uid != uid1 and MM_INDEX.get(cand_uid, (None, None))[0] == guild.id:
-                uid2, t2 = cand_uid, cand_t
-                break
+async def _try_matchmake_rating(guild: discord.Guild):
+    """Pair each queued player (longest wait first) with the closest-points opponent inside their window."""
+    q = _ensure_queue(guild.id)
+    for uid in list(q):
+        if uid not in q:
+            continue  # paired earlier in this pass
+        if player_busy(uid):
+            await _dequeue_user(uid)  # started a match some other way
+            continue
+        opp = _closest_opponent(guild.id, uid, _now_mono())
+        if opp is not None:
+            await _pair_players(guild, uid, opp)
 
-        if uid2 is None:
-            # put uid1 back; not enough distinct players
-            q.appendleft((uid1, t1))
-            break
+    # windows widen with time, so look again later if people are still waiting
+    if len(q) >= 2 and SCHEDULER.pending("mm_recheck", guild.id) is None:
+        await SCHEDULER.schedule("mm_recheck", guild.id, time.time() + MM_RATING_WINDOW_EVERY_S)
 
-        # dequeue both
-        MM_INDEX.pop(uid1, None)
-        MM_INDEX.pop(uid2, None)
+async def _pair_players(guild: discord.Guild, uid1: int, uid2: int):
+    q = _ensure_queue(guild.id)
+    now = _now_mono()
+    waits = (now - q.get(uid1, now), now - q.get(uid2, now))
+    spread = abs(MM_POINTS.get(uid1, 0) - MM_POINTS.get(uid2, 0))
+
+    # one of them started a match some other way: drop only them, the other keeps their place
+    busy = [uid for uid in (uid1, uid2) if player_busy(uid)]
+    if busy:
+        for uid in busy:
+            await _dequeue_user(uid)
+        return
+
+    # dequeue both and reserve them before the next await, so nothing else can grab them
+    _remove_from_queue(guild.id, uid1)
+    _remove_from_queue(guild.id, uid2)
+    _STARTING_USERS.update((uid1, uid2))
+    await SCHEDULER.cancel("queue_timeout", uid1)
+    await SCHEDULER.cancel("queue_timeout", uid2)
+
+    METRICS.inc("queue_pairs")
+    for w in waits:
+        METRICS.observe("queue_wait_seconds", w)
+    METRICS.observe("pair_points_gap", spread, POINTS_GAP_BUCKETS)
+
+    # 🔔 SAME flow as challenge acceptance, started as its own task so a burst of
+    # pairings doesn't queue behind each match's API calls.
+    asyncio.create_task(_start_reserved(guild, uid1, uid2))
+
+async def _on_mm_recheck(guild_id: int, _payload: dict):
+    guild = bot2.get_guild(guild_id)
+    if guild:
+        await _try_matchmake(guild)
+
+def note_opponents(a_id: int, b_id: int, at: float):
+    for uid, opp in ((a_id, b_id), (b_id, a_id)):
+        RECENT_OPPONENTS.setdefault(uid, deque(maxlen=MM_REMATCH_K)).append((opp, at))
+
+def recently_played(a_id: int, b_id: int) -> bool:
+    cutoff = time.time() - MM_REMATCH_COOLDOWN_S
+    return any(opp == b_id and at >= cutoff for opp, at in RECENT_OPPONENTS.get(a_id, ()))
+
+async def warm_recent_opponents():
+    """Rebuild RECENT_OPPONENTS from matches played inside the cooldown window."""
+    RECENT_OPPONENTS.clear()
+    for winner_id, loser_id, at in await db_read(get_recent_matches, MM_REMATCH_COOLDOWN_S):
+        note_opponents(winner_id, loser_id, at)
+
+def _rating_window(joined: float, now: float) -> int:
+    """± points a player will accept; grows the longer they wait."""
+    steps = int((now - joined) // MM_RATING_WINDOW_EVERY_S)
+    return MM_RATING_WINDOW + steps * MM_RATING_WINDOW_STEP
+
+def _closest_opponent(gid: int, uid: int, now: float) -> int | None:
+    """
+    Nearest neighbour by points in the guild's sorted ratings, if within uid's window.
+    Walks outward from uid's slot, skipping recent opponents (at most MM_REMATCH_K of them)
+    and anyone already in a match.
+    """
+    ratings = MM_RATINGS.get(gid) or []
+    pts = MM_POINTS.get(uid)
+    if pts is None:
+        return None
+    window = _rating_window(_ensure_queue(gid).get(uid, now), now)
+    i = bisect.bisect_left(ratings, (pts, uid))
+    lo, hi = i - 1, i + 1
+    while lo >= 0 or hi < len(ratings):
+        if hi >= len(ratings) or (lo >= 0 and pts - ratings[lo][0] <= ratings[hi][0] - pts):
+            cand_pts, cand_uid = ratings[lo]
+            lo -= 1
+        else:
+            cand_pts, cand_uid = ratings[hi]
+            hi += 1
+        if abs(cand_pts - pts) > window:
+            return None
+        if not recently_played(uid, cand_uid) and not player_busy(cand_uid):
+            return cand_uid
+    return None
+
+async def _on_queue_timeout(user_id: int, payload: dict):
+    """DeadlineScheduler handler: expire a queue entry that found no opponent."""
+    gid = payload.get("guild_id")
+    entry = MM_INDEX.get(user_id)
+    if not entry or entry[0] != gid or entry[1] != payload.get("joined"):
+        return  # left, got paired, or re-joined since this timer was set
+    _remove_from_queue(gid, user_id)
+    METRICS.inc("queue_timeouts")
+    guild = bot2.get_guild(gid)
+    if guild:
+        member = await get_member_safe(guild, user_id)
+        if member:
+            await _notify_timeout(member)
+
+
+async def _on_challenge_expiry(challenge_id: int, _payload: dict):
+    """DeadlineScheduler handler: flip a still-pending challenge to 'expired'."""
+    await db_write(expire_challenge_if_pending, challenge_id)
 
-        # 🔔 Use the SAME function used after challenge acceptance
-        await start_match_from_challenge(guild, uid1, uid2)
-        # loop continues to try pairing more players if available
 
 def _now_mono() -> float:
     return time.monotonic()
 
-def _ensure_queue(gid: int) -> deque[tuple[int, float]]:
+def _ensure_queue(gid: int) -> OrderedDict[int, float]:
     if gid not in MM_QUEUES:
-        MM_QUEUES[gid] = deque()
+        MM_QUEUES[gid] = OrderedDict()
     return MM_QUEUES[gid]
 
 def _remove_from_queue(gid: int, uid: int) -> bool:
     """Remove a user from a guild queue; returns True if removed."""
-    q = _ensure_queue(gid)
-    removed = False
-    if uid in MM_INDEX:
-        # rebuild the queue without this user
-        newq = deque((u, t) for (u, t) in q if u != uid)
-        if len(newq) != len(q):
-            MM_QUEUES[gid] = newq
-            removed = True
     MM_INDEX.pop(uid, None)
-    return removed
+    pts = MM_POINTS.pop(uid, None)
+    if pts is not None:
+        ratings = MM_RATINGS.get(gid, [])
+        i = bisect.bisect_left(ratings, (pts, uid))
+        if i < len(ratings) and ratings[i] == (pts, uid):
+            del ratings[i]
+    return _ensure_queue(gid).pop(uid, None) is not None
+
+async def _dequeue_user(uid: int):
+    """Drop a user from whichever queue they're in (e.g. they started a challenge match)."""
+    entry = MM_INDEX.get(uid)
+    if entry and _remove_from_queue(entry[0], uid):
+        await SCHEDULER.cancel("queue_timeout", uid)
 
 
 
-# Try to load a nicer font; fallback to default
+# Try to load a nicer font; fallback to default (memoized: one probe + load per size)
+@functools.lru_cache(maxsize=None)
 def _load_font(size=28):
     for path in ("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
                  "/System/Library/Fonts/Supplemental/Arial Unicode.ttf",
@@ -617,10 +1273,13 @@ def _circle_crop(im: Image.Image, size: int) -> Image.Image:
 
 
 
-def load_leaderboard_message_id_from_db(guild_id: int):
+async def load_leaderboard_message_id_from_db(guild_id: int):
     global LEADERBOARD_MESSAGE_ID
-    saved = get_setting(guild_id, LB_KEY)
+    saved = await db_read(get_setting, guild_id, LB_KEY)
     LEADERBOARD_MESSAGE_ID = int(saved) if saved and saved.isdigit() else None
+    digest = await db_read(get_setting, guild_id, LB_DIGEST_KEY)
+    if digest:
+        _LB_POSTED_DIGEST[guild_id] = digest
 
 
 async def resolve_user_display(
@@ -723,22 +1382,40 @@ STREAK_BONUS = 5  # applied for every win after the first (i.e., streak >= 2)
 
 
 # ------- Bot 2: Color-role helpers -------
+# guild_id -> {"by_emoji": {emoji_name: Role}, "role_ids": frozenset, "emojis": {emoji_name: Emoji}}
+# Built from COLOR_ROLE_MAP on first use; rebuilt when roles or emojis change in the guild.
+COLOR_INDEX: dict[int, dict] = {}
+
+
+def refresh_color_index(guild: discord.Guild) -> dict:
+    emojis_by_name = {e.name: e for e in guild.emojis}
+    by_emoji, emojis = {}, {}
+    for emoji_name, role_id in COLOR_ROLE_MAP.items():
+        role = guild.get_role(role_id)
+        if role:
+            by_emoji[emoji_name] = role
+        if emoji_name in emojis_by_name:
+            emojis[emoji_name] = emojis_by_name[emoji_name]
+    idx = {"by_emoji": by_emoji, "role_ids": frozenset(r.id for r in by_emoji.values()), "emojis": emojis}
+    COLOR_INDEX[guild.id] = idx
+    return idx
+
+
+def color_index(guild: discord.Guild) -> dict:
+    return COLOR_INDEX.get(guild.id) or refresh_color_index(guild)
+
+
 def _color_roles_in_guild(guild: discord.Guild) -> list[discord.Role]:
     """Return all colour Role objects that exist in this guild."""
-    roles = []
-    for rid in COLOR_ROLE_MAP.values():
-        r = guild.get_role(rid)
-        if r:
-            roles.append(r)
-    return roles
+    return list(color_index(guild)["by_emoji"].values())
 
 async def _ensure_single_color(member: discord.Member, new_role: discord.Role | None):
     """
     Remove any existing color roles from this member, then (optionally) add new_role.
     """
-    color_roles = set(_color_roles_in_guild(member.guild))
+    color_ids = color_index(member.guild)["role_ids"]
     # Remove any color roles the user already has
-    to_remove = [r for r in member.roles if r in color_roles and (new_role is None or r.id != new_role.id)]
+    to_remove = [r for r in member.roles if r.id in color_ids and (new_role is None or r.id != new_role.id)]
     if to_remove:
         try:
             await member.remove_roles(*to_remove, reason="Enforcing single colour role")
@@ -752,29 +1429,533 @@ async def _ensure_single_color(member: discord.Member, new_role: discord.Role |
             print(f"[Bot2] Failed adding color role {new_role.id} to {member.id}: {e}")
 
 async def _sweep_fix_duplicate_colors(guild: discord.Guild):
-    color_roles = set(_color_roles_in_guild(guild))
-    if not color_roles:
+    color_ids = color_index(guild)["role_ids"]
+    if not color_ids:
         return
+    ops = []
     for member in guild.members:
         # Find all colour roles this member has
-        theirs = [r for r in member.roles if r in color_roles]
+        theirs = [r for r in member.roles if r.id in color_ids]
         if len(theirs) > 1:
             # Keep the highest-position role (Discord typically treats higher position as “dominant”)
             keep = max(theirs, key=lambda r: r.position)
-            try:
-                to_remove = [r for r in theirs if r.id != keep.id]
-                if to_remove:
-                    await member.remove_roles(*to_remove, reason="Startup sweep: duplicate color roles")
-            except Exception as e:
-                print(f"[Bot2] Sweep failed for {member.id}: {e}")
+            ops.append((member.id, (), {r.id for r in theirs if r.id != keep.id}))
+    if ops:
+        await ROLE_QUEUE.submit(guild.id, ops, reason="Startup sweep: duplicate color roles",
+                                job=f"color_sweep:{guild.id}")
 
 
 
 # ---------- DB ----------
 WARN_DB_PATH = "warnings.db"
 
+# Pragmas applied once to every pooled connection (leaderboard.db + warnings.db).
+# WAL lets readers run while a write is in progress; synchronous=NORMAL skips the
+# per-commit fsync that WAL does not need for durability of committed pages.
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=67108864",  # 64 MiB
+    "PRAGMA cache_size=-8192",    # ~8 MiB page cache (negative = KiB)
+    "PRAGMA busy_timeout=5000",
+)
+SQLITE_CACHED_STATEMENTS = 256
+
+# One long-lived connection per (thread, db file); never shared between threads.
+_DB_LOCAL = threading.local()
+_DB_ALL: list[sqlite3.Connection] = []
+_DB_ALL_LOCK = threading.Lock()
+
+
+def _open_db(path: str) -> sqlite3.Connection:
+    # check_same_thread=False only so close_db_pool() can close it at shutdown.
+    con = sqlite3.connect(path, timeout=5.0, cached_statements=SQLITE_CACHED_STATEMENTS, check_same_thread=False)
+    for pragma in SQLITE_PRAGMAS:
+        con.execute(pragma)
+    return con
+
+
+def _db(path: str | None = None) -> sqlite3.Connection:
+    """
+    Return this thread's pooled connection for `path` (defaults to DB_PATH).
+    Use it like the old per-call connections: `with _db() as con:` commits on success.
+    """
+    path = path or DB_PATH
+    conns = getattr(_DB_LOCAL, "conns", None)
+    if conns is None:
+        conns = _DB_LOCAL.conns = {}
+    con = conns.get(path)
+    if con is None:
+        con = conns[path] = _open_db(path)
+        with _DB_ALL_LOCK:
+            _DB_ALL.append(con)
+    return con
+
+
+def _ensure_warn_conn() -> sqlite3.Connection:
+    return _db(WARN_DB_PATH)
+
+
+def close_db_pool():
+    """Close every pooled connection (call once on shutdown)."""
+    with _DB_ALL_LOCK:
+        for con in _DB_ALL:
+            try:
+                con.close()
+            except Exception:
+                pass
+        _DB_ALL.clear()
+
+
+# ---------- Async DB facade ----------
+# SQLite never runs on the gateway loop. Writes go to ONE writer thread, so they are
+# applied in submission order and can't interleave (e.g. two admins confirming at once);
+# reads go to a small pool that sees every committed write thanks to WAL.
+DB_READER_THREADS = 3
+_DB_WRITER = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bot2-db-writer")
+_DB_READERS = ThreadPoolExecutor(max_workers=DB_READER_THREADS, thread_name_prefix="bot2-db-reader")
+
+
+async def db_read(fn, *args, **kwargs):
+    """Run a read-only DB helper on the reader pool and await its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_DB_READERS, functools.partial(fn, *args, **kwargs))
+
+
+async def db_write(fn, *args, **kwargs):
+    """Run a DB helper that writes on the single writer thread and await its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_DB_WRITER, functools.partial(fn, *args, **kwargs))
+
+
+def shutdown_db():
+    """Drain the DB threads, then close their connections."""
+    _DB_WRITER.shutdown(wait=True)
+    _DB_READERS.shutdown(wait=True)
+    close_db_pool()
+
+
+# ---------- Deadline scheduler ----------
+def save_deadline(kind: str, key: int, due_at: float, payload: dict | None):
+    with _db() as con:
+        con.execute(
+            "REPLACE INTO deadlines (kind, key, due_at, payload) VALUES (?, ?, ?, ?)",
+            (kind, key, due_at, json.dumps(payload or {}))
+        )
+
+def delete_deadline(kind: str, key: int):
+    with _db() as con:
+        con.execute("DELETE FROM deadlines WHERE kind=? AND key=?", (kind, key))
+
+def load_deadlines():
+    with _db() as con:
+        cur = con.execute("SELECT kind, key, due_at, payload FROM deadlines")
+        return [(kind, key, due_at, json.loads(payload or "{}")) for kind, key, due_at, payload in cur.fetchall()]
+
+
+class DeadlineScheduler:
+    """
+    Every timed job in the bot (match timeouts, room cleanups, challenge expiries,
+    queue timeouts) lives in one min-heap served by a single task that sleeps until
+    the earliest deadline, instead of one sleeping task per job.
+
+    Jobs are identified by (kind, key): scheduling the same id again moves it,
+    cancel() drops it. Kinds registered with persist=True are mirrored to the
+    `deadlines` table and come back through load() after a restart.
+    Times are unix seconds (time.time()) so they survive restarts.
+    """
+
+    def __init__(self):
+        self._heap: list[tuple[float, int, str, int]] = []          # (due_at, seq, kind, key)
+        self._jobs: dict[tuple[str, int], tuple[float, int, dict]] = {}  # id -> (due_at, seq, payload)
+        self._handlers: dict[str, tuple] = {}                       # kind -> (handler, persist)
+        self._seq = itertools.count()
+        self._wake = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def register(self, kind: str, handler, persist: bool = False):
+        """handler: async def handler(key: int, payload: dict)"""
+        self._handlers[kind] = (handler, persist)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def schedule(self, kind: str, key: int, due_at: float, payload: dict | None = None, _persist: bool = True):
+        payload = payload or {}
+        seq = next(self._seq)
+        self._jobs[(kind, key)] = (due_at, seq, payload)
+        heapq.heappush(self._heap, (due_at, seq, kind, key))
+        self._compact()
+        self._wake.set()
+        if _persist and self._handlers.get(kind, (None, False))[1]:
+            try:
+                await db_write(save_deadline, kind, key, due_at, payload)
+            except Exception as e:
+                print(f"[Bot2] Could not persist deadline {kind}:{key}: {e}")
+
+    async def cancel(self, kind: str, key: int) -> bool:
+        """Drop a pending job; returns True if one was pending. Heap entry is skipped lazily."""
+        existed = self._jobs.pop((kind, key), None) is not None
+        if existed and self._handlers.get(kind, (None, False))[1]:
+            try:
+                await db_write(delete_deadline, kind, key)
+            except Exception as e:
+                print(f"[Bot2] Could not delete deadline {kind}:{key}: {e}")
+        return existed
+
+    def pending(self, kind: str, key: int) -> float | None:
+        job = self._jobs.get((kind, key))
+        return job[0] if job else None
+
+    def next_due(self) -> float | None:
+        return min((due for due, _seq, _p in self._jobs.values()), default=None)
+
+    def pending_counts(self) -> dict[str, int]:
+        counts = {kind: 0 for kind in self._handlers}
+        for kind, _key in self._jobs:
+            counts[kind] = counts.get(kind, 0) + 1
+        return counts
+
+    async def load(self):
+        """Rehydrate persisted jobs (overdue ones fire right away)."""
+        for kind, key, due_at, payload in await db_read(load_deadlines):
+            if (kind, key) not in self._jobs:
+                await self.schedule(kind, key, due_at, payload, _persist=False)
+
+    def _compact(self):
+        # Cancelled/rescheduled entries stay in the heap until popped; rebuild if they pile up.
+        if len(self._heap) > 2 * len(self._jobs) + 64:
+            self._heap = [(due, seq, kind, key) for (kind, key), (due, seq, _p) in self._jobs.items()]
+            heapq.heapify(self._heap)
+
+    async def _run(self):
+        while True:
+            now = time.time()
+            while self._heap and self._heap[0][0] <= now:
+                due, seq, kind, key = heapq.heappop(self._heap)
+                job = self._jobs.get((kind, key))
+                if job is None or job[1] != seq:
+                    continue  # cancelled or rescheduled
+                del self._jobs[(kind, key)]
+                asyncio.create_task(self._fire(kind, key, job[2]))
+
+            self._wake.clear()
+            timeout = (self._heap[0][0] - now) if self._heap else None
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _fire(self, kind: str, key: int, payload: dict):
+        handler, persist = self._handlers.get(kind, (None, False))
+        try:
+            if handler:
+                await handler(key, payload)
+            else:
+                print(f"[Bot2] No handler for deadline kind {kind!r}")
+        except Exception as e:
+            METRICS.inc("deadline_failures")
+            print(f"[Bot2] Deadline {kind}:{key} failed: {e}")
+        if persist and (kind, key) not in self._jobs:  # handler may have re-armed it
+            try:
+                await db_write(delete_deadline, kind, key)
+            except Exception as e:
+                print(f"[Bot2] Could not delete deadline {kind}:{key}: {e}")
+
+
+SCHEDULER = DeadlineScheduler()
+
+
+# ---------- Role mutation queue ----------
+ROLE_MUTATION_CONCURRENCY = 3          # member edits in flight at once
+ROLE_MUTATION_GUILD_INTERVAL_S = 0.25  # min gap between member edits in one guild
+
+
+def save_role_jobs(rows: list[tuple]):
+    with _db() as con:
+        con.executemany(
+            "REPLACE INTO role_jobs (guild_id, user_id, add_ids, remove_ids, reason, job) VALUES (?, ?, ?, ?, ?, ?)",
+            rows
+        )
+
+def delete_role_job(guild_id: int, user_id: int):
+    with _db() as con:
+        con.execute("DELETE FROM role_jobs WHERE guild_id=? AND user_id=?", (guild_id, user_id))
+
+def load_role_jobs():
+    with _db() as con:
+        cur = con.execute("SELECT guild_id, user_id, add_ids, remove_ids, reason, job FROM role_jobs")
+        return [(gid, uid, set(json.loads(add)), set(json.loads(rem)), reason, job)
+                for gid, uid, add, rem, reason, job in cur.fetchall()]
+
+
+class RoleMutationQueue:
+    """
+    Shared queue for bulk role changes (clearcolors, the duplicate-colour sweep, booster cleanup).
+
+    Changes are coalesced per member into one pending (add, remove) set and applied by
+    ROLE_MUTATION_CONCURRENCY workers as per-role add/remove calls, diffed against the member's
+    roles at send time, so roles changed while an edit waits (a colour pick, another admin) are
+    left alone. Member edits share a per-guild rate-limit route, so calls in a guild are spaced
+    ROLE_MUTATION_GUILD_INTERVAL_S apart; discord.py still handles any 429 that slips through.
+    Pending edits are mirrored to `role_jobs` and reloaded by load(), so a sweep interrupted by a
+    restart picks up where it left off. Progress is tracked per job name in `progress`; a member
+    touched by several jobs counts toward each of them.
+    """
+
+    def __init__(self):
+        self._pending: dict[tuple[int, int], dict] = {}  # (guild_id, user_id) -> {"add", "remove", "reason", "jobs"}
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._workers: list[asyncio.Task] = []
+        self._next_slot: dict[int, float] = {}           # guild_id -> monotonic time of next allowed edit
+        self.progress: dict[str, dict] = {}              # job -> {"total", "done", "failed"}
+
+    def start(self):
+        self._workers = [t for t in self._workers if not t.done()]
+        while len(self._workers) < ROLE_MUTATION_CONCURRENCY:
+            self._workers.append(asyncio.create_task(self._worker()))
+
+    def _enqueue(self, key: tuple[int, int], op: dict):
+        self._pending[key] = op
+        self._queue.put_nowait(key)
+        for job in op["jobs"]:
+            self._count(job)
+
+    def _count(self, job: str):
+        self.progress.setdefault(job, {"total": 0, "done": 0, "failed": 0})["total"] += 1
+
+    async def submit(self, guild_id: int, ops: list[tuple[int, set, set]], reason: str, job: str) -> int:
+        """Queue (user_id, add_role_ids, remove_role_ids) changes; returns how many members were touched."""
+        rows = []
+        for uid, add, remove in ops:
+            key = (guild_id, uid)
+            op = self._pending.get(key)
+            if op is None:
+                op = {"add": set(), "remove": set(), "reason": reason, "jobs": {job}}
+                self._enqueue(key, op)
+            elif job not in op["jobs"]:
+                op["jobs"].add(job)
+                self._count(job)
+            # later requests win over earlier ones for the same role
+            op["add"] = (op["add"] - set(remove)) | set(add)
+            op["remove"] = (op["remove"] - set(add)) | set(remove)
+            rows.append((guild_id, uid, json.dumps(sorted(op["add"])), json.dumps(sorted(op["remove"])),
+                         op["reason"], ",".join(sorted(op["jobs"]))))
+        if rows:
+            try:
+                await db_write(save_role_jobs, rows)
+            except Exception as e:
+                print(f"[Bot2] Could not persist role jobs ({job}): {e}")
+        return len(rows)
+
+    def job_done(self, job: str) -> bool:
+        p = self.progress.get(job)
+        return p is None or p["done"] + p["failed"] >= p["total"]
+
+    async def load(self):
+        """Re-queue edits persisted before a restart."""
+        for gid, uid, add, remove, reason, jobs in await db_read(load_role_jobs):
+            if (gid, uid) not in self._pending:
+                self._enqueue((gid, uid), {"add": add, "remove": remove, "reason": reason,
+                                           "jobs": set(jobs.split(","))})
+        if self._pending:
+            print(f"[Bot2] Resuming {len(self._pending)} pending role edit(s).")
+
+    async def _pace(self, guild_id: int):
+        now = time.monotonic()
+        slot = max(now, self._next_slot.get(guild_id, 0.0))
+        self._next_slot[guild_id] = slot + ROLE_MUTATION_GUILD_INTERVAL_S
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def _apply(self, key: tuple[int, int], op: dict) -> bool:
+        gid, uid = key
+        guild = bot2.get_guild(gid)
+        if guild is None:
+            return False
+        member = await get_member_safe(guild, uid)
+        if member is None:
+            return True  # left the guild; nothing to change
+        if not self._diff(guild, member, op):
+            return True
+        await self._pace(gid)
+        # Diff again after the wait: roles may have changed while this edit sat in the backlog
+        member = guild.get_member(uid) or member
+        changes = self._diff(guild, member, op)
+        try:
+            for i, (call, role) in enumerate(changes):
+                if i:
+                    await self._pace(gid)
+                await call(role, reason=op["reason"])
+            return True
+        except discord.HTTPException as e:
+            print(f"[Bot2] Role edit failed for {uid} ({', '.join(sorted(op['jobs']))}): {e}")
+            return False
+
+    @staticmethod
+    def _diff(guild: discord.Guild, member: discord.Member, op: dict) -> list[tuple]:
+        have = {r.id for r in member.roles}
+        changes = [(member.remove_roles, r) for r in member.roles if r.id in op["remove"]]
+        for rid in op["add"] - have:
+            role = guild.get_role(rid)
+            if role:
+                changes.append((member.add_roles, role))
+        return changes
+
+    async def _worker(self):
+        while True:
+            key = await self._queue.get()
+            op = self._pending.pop(key, None)
+            if op is None:
+                continue
+            try:
+                ok = await self._apply(key, op)
+            except Exception as e:
+                print(f"[Bot2] Role edit error for {key[1]} ({', '.join(sorted(op['jobs']))}): {e}")
+                ok = False
+            for job in op["jobs"]:
+                prog = self.progress.get(job)
+                if prog:
+                    prog["done" if ok else "failed"] += 1
+            if key not in self._pending:  # a newer change for this member re-saved the row
+                try:
+                    await db_write(delete_role_job, *key)
+                except Exception as e:
+                    print(f"[Bot2] Could not clear role job {key}: {e}")
+
+
+ROLE_QUEUE = RoleMutationQueue()
+
+
+async def report_role_job(message: discord.Message, job: str, label: str, every_s: float = 5.0):
+    """Keep `message` updated with a role job's progress until every queued member is handled."""
+    while not ROLE_QUEUE.job_done(job):
+        await asyncio.sleep(every_s)
+        p = ROLE_QUEUE.progress.get(job)
+        if p:
+            try:
+                await message.edit(content=f"⏳ {label}: {p['done'] + p['failed']}/{p['total']} members…")
+            except discord.HTTPException:
+                pass
+    p = ROLE_QUEUE.progress.pop(job, None) or {"done": 0, "failed": 0}
+    failed = f", {p['failed']} failed" if p["failed"] else ""
+    try:
+        await message.edit(content=f"✅ {label}: {p['done']} members done{failed}.")
+    except discord.HTTPException:
+        pass
+
+
+# ---------- Metrics ----------
+# In-process histograms + counters for the 1v1 pipeline; read via ?metrics or,
+# when BOT2_METRICS_PORT is set, as Prometheus-style text on 127.0.0.1:<port>/metrics.
+LATENCY_BUCKETS_S = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 900, 1800, 3600)
+POINTS_GAP_BUCKETS = (0, 10, 25, 50, 100, 200, 400, 800)
+
+
+class Histogram:
+    """Fixed buckets (upper bounds, inclusive) plus an overflow bucket; O(log buckets) per observe."""
+
+    def __init__(self, buckets: tuple):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float | None:
+        """Upper bound of the bucket holding the q-quantile (inf if it's in the overflow bucket)."""
+        if not self.count:
+            return None
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= q * self.count:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+
+class Metrics:
+    def __init__(self):
+        self.histograms: dict[str, Histogram] = {}
+        self.counters: dict[str, int] = {}
+
+    def observe(self, name: str, value: float, buckets: tuple = LATENCY_BUCKETS_S):
+        hist = self.histograms.get(name)
+        if hist is None:
+            hist = self.histograms[name] = Histogram(buckets)
+        hist.observe(value)
+
+    def inc(self, name: str, n: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def mean(self, name: str) -> float | None:
+        hist = self.histograms.get(name)
+        return hist.total / hist.count if hist and hist.count else None
+
+    def summary_lines(self) -> list[str]:
+        lines = []
+        for name, h in sorted(self.histograms.items()):
+            lines.append(f"{name}: n={h.count} avg={h.total / h.count:.2f} "
+                         f"p50≤{h.quantile(0.5):g} p95≤{h.quantile(0.95):g}")
+        for name, n in sorted(self.counters.items()):
+            lines.append(f"{name}: {n}")
+        return lines
+
+    def render_text(self) -> str:
+        out = []
+        for name, h in sorted(self.histograms.items()):
+            out.append(f"# TYPE bot2_{name} histogram")
+            cumulative = 0
+            bounds = [f"{b:g}" for b in h.buckets] + ["+Inf"]
+            for bound, c in zip(bounds, h.counts):
+                cumulative += c
+                out.append(f'bot2_{name}_bucket{{le="{bound}"}} {cumulative}')
+            out.append(f"bot2_{name}_sum {h.total}")
+            out.append(f"bot2_{name}_count {h.count}")
+        for name, n in sorted(self.counters.items()):
+            out.append(f"# TYPE bot2_{name}_total counter")
+            out.append(f"bot2_{name}_total {n}")
+        return "\n".join(out) + "\n"
+
+
+METRICS = Metrics()
+_METRICS_RUNNER = None
+
+
+async def start_metrics_server():
+    """Serve METRICS as text on 127.0.0.1:$BOT2_METRICS_PORT/metrics (off unless the env var is set)."""
+    global _METRICS_RUNNER
+    port = int(os.getenv("BOT2_METRICS_PORT") or 0)
+    if not port or _METRICS_RUNNER is not None:
+        return
+    from aiohttp import web
+
+    async def _handle(_request):
+        return web.Response(text=METRICS.render_text(), content_type="text/plain")
+
+    app = web.Application()
+    app.router.add_get("/metrics", _handle)
+    _METRICS_RUNNER = web.AppRunner(app)
+    await _METRICS_RUNNER.setup()
+    await web.TCPSite(_METRICS_RUNNER, "127.0.0.1", port).start()
+    print(f"[Bot2] Metrics on http://127.0.0.1:{port}/metrics")
+
+
+async def stop_metrics_server():
+    global _METRICS_RUNNER
+    if _METRICS_RUNNER is not None:
+        await _METRICS_RUNNER.cleanup()
+        _METRICS_RUNNER = None
+
+
 def _warn_db():
-    conn = sqlite3.connect(WARN_DB_PATH)
+    conn = _ensure_warn_conn()
     conn.execute("""
     CREATE TABLE IF NOT EXISTS warnings (
         guild_id INTEGER NOT NULL,
@@ -799,7 +1980,7 @@ def _warn_db():
 
 
 def _init_settings():
-    with sqlite3.connect(DB_PATH) as con:
+    with _db() as con:
         con.execute("""
             CREATE TABLE IF NOT EXISTS settings (
                 guild_id INTEGER NOT NULL,
@@ -831,14 +2012,14 @@ def clamp_points(conn, user_id: int, delta: int):
 
 
 def set_setting(guild_id: int, key: str, value: str):
-    with sqlite3.connect(DB_PATH) as con:
+    with _db() as con:
         con.execute(
             "REPLACE INTO settings (guild_id, key, value) VALUES (?, ?, ?)",
             (guild_id, key, value)
         )
 
 def get_setting(guild_id: int, key: str) -> str | None:
-    with sqlite3.connect(DB_PATH) as con:
+    with _db() as con:
         cur = con.execute(
             "SELECT value FROM settings WHERE guild_id=? AND key=?",
             (guild_id, key)
@@ -848,7 +2029,7 @@ def get_setting(guild_id: int, key: str) -> str | None:
 
 
 def init_db():
-    with sqlite3.connect(DB_PATH) as con:
+    with _db() as con:
         cur = con.cursor()
 
         # --- Core tables ---
@@ -857,7 +2038,9 @@ def init_db():
                 user_id INTEGER PRIMARY KEY,
                 wins    INTEGER NOT NULL DEFAULT 0,
                 points  INTEGER NOT NULL DEFAULT 0,
-                streak  INTEGER NOT NULL DEFAULT 0
+                streak  INTEGER NOT NULL DEFAULT 0,
+                losses  INTEGER NOT NULL DEFAULT 0,
+                played  INTEGER NOT NULL DEFAULT 0
             )
         """)
 
@@ -881,6 +2064,60 @@ def init_db():
             )
         """)
 
+        # --- In-flight 1v1s (one row per admin card; mirrors MATCHES across restarts) ---
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS active_matches (
+                admin_msg_id    INTEGER PRIMARY KEY,
+                guild_id        INTEGER NOT NULL,
+                a_id            INTEGER NOT NULL,
+                b_id            INTEGER NOT NULL,
+                announce_ch_id  INTEGER,
+                announce_msg_id INTEGER,
+                text_chan_id    INTEGER,
+                voice_chan_id   INTEGER,
+                score           TEXT,
+                started_at      REAL,           -- unix time the match was set up
+                deadline        REAL NOT NULL,  -- unix time the safety timeout fires
+                created_at      TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+        # --- Persisted DeadlineScheduler jobs (room cleanups, challenge expiries) ---
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS deadlines (
+                kind    TEXT    NOT NULL,
+                key     INTEGER NOT NULL,
+                due_at  REAL    NOT NULL,  -- unix time
+                payload TEXT,              -- JSON
+                PRIMARY KEY (kind, key)
+            )
+        """)
+
+        # --- Current colour-panel reaction per member (see COLOR_PICKS) ---
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS color_picks (
+                guild_id   INTEGER NOT NULL,
+                user_id    INTEGER NOT NULL,
+                message_id INTEGER NOT NULL,
+                emoji_name TEXT    NOT NULL,
+                emoji_id   INTEGER,
+                PRIMARY KEY (guild_id, user_id)
+            )
+        """)
+
+        # --- Pending RoleMutationQueue edits (one coalesced row per member; resumed on startup) ---
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS role_jobs (
+                guild_id   INTEGER NOT NULL,
+                user_id    INTEGER NOT NULL,
+                add_ids    TEXT    NOT NULL,  -- JSON list of role ids
+                remove_ids TEXT    NOT NULL,  -- JSON list of role ids
+                reason     TEXT,
+                job        TEXT    NOT NULL,  -- comma-separated job names that touched this member
+                PRIMARY KEY (guild_id, user_id)
+            )
+        """)
+
         # --- Meta (for persistent bot settings like leaderboard channel/message ids) ---
         cur.execute("""
             CREATE TABLE IF NOT EXISTS meta (
@@ -896,10 +2133,35 @@ def init_db():
         if "streak" not in cols:
             cur.execute("ALTER TABLE wins ADD COLUMN streak INTEGER NOT NULL DEFAULT 0")
 
+        # losses/played are maintained by record_match_and_points; backfill them once
+        # from the match history when the columns are first added.
+        if "losses" not in cols or "played" not in cols:
+            if "losses" not in cols:
+                cur.execute("ALTER TABLE wins ADD COLUMN losses INTEGER NOT NULL DEFAULT 0")
+            if "played" not in cols:
+                cur.execute("ALTER TABLE wins ADD COLUMN played INTEGER NOT NULL DEFAULT 0")
+            cur.execute("INSERT OR IGNORE INTO wins (user_id) SELECT DISTINCT loser_id FROM matches")
+            cur.execute("""
+                UPDATE wins SET
+                    losses = (SELECT COUNT(*) FROM matches WHERE loser_id = wins.user_id),
+                    played = (SELECT COUNT(*) FROM matches WHERE winner_id = wins.user_id)
+                           + (SELECT COUNT(*) FROM matches WHERE loser_id = wins.user_id)
+            """)
+
+        # active_matches rows from before started_at was stored: the row was written when the
+        # match was set up, so created_at (UTC) is the start time
+        cols = {r[1] for r in cur.execute("PRAGMA table_info(active_matches)").fetchall()}
+        if "started_at" not in cols:
+            cur.execute("ALTER TABLE active_matches ADD COLUMN started_at REAL")
+            cur.execute("UPDATE active_matches SET started_at = CAST(strftime('%s', created_at) AS REAL)")
+
         # --- Helpful indexes ---
         cur.execute("CREATE INDEX IF NOT EXISTS idx_matches_winner  ON matches(winner_id)")
         cur.execute("CREATE INDEX IF NOT EXISTS idx_matches_loser   ON matches(loser_id)")
         cur.execute("CREATE INDEX IF NOT EXISTS idx_challenges_user ON challenges(guild_id, status, challenger_id, opponent_id)")
+        # Covers the leaderboard ORDER BY and the rank COUNT(*)s in get_leaderboard_position
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_wins_rank ON wins(points DESC, wins DESC, user_id)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_matches_time ON matches(match_time)")
 
         con.commit()
 
@@ -912,18 +2174,19 @@ def record_match_and_points(winner_id: int, loser_id: int):
     """
     Applies:
     - winner: +10 points, +1 win, streak +=1, and if streak_after >=2 → +5 bonus
-    - loser:  -10 points, streak = 0
-    - inserts match row
+    - loser:  -10 points, +1 loss, streak = 0
+    - both:   +1 played
+    - inserts match row (all in one transaction)
     """
-    with sqlite3.connect(DB_PATH) as con:
+    with _db() as con:
         cur = con.cursor()
         _ensure_user_rows(con, winner_id, loser_id)
 
         # Get current states
-        cur.execute("SELECT wins, points, streak FROM wins WHERE user_id=?", (winner_id,))
-        w_wins, w_pts, w_str = cur.fetchone()
-        cur.execute("SELECT wins, points, streak FROM wins WHERE user_id=?", (loser_id,))
-        l_wins, l_pts, l_str = cur.fetchone()
+        cur.execute("SELECT wins, points, streak, losses FROM wins WHERE user_id=?", (winner_id,))
+        w_wins, w_pts, w_str, w_losses = cur.fetchone()
+        cur.execute("SELECT wins, points, streak, losses FROM wins WHERE user_id=?", (loser_id,))
+        l_wins, l_pts, l_str, l_losses = cur.fetchone()
 
         # Winner updates
         new_wins = w_wins + 1
@@ -934,26 +2197,31 @@ def record_match_and_points(winner_id: int, loser_id: int):
         # Loser updates
         l_new_points = l_pts + LOSS_POINTS
         l_new_streak = 0  # reset on loss
+        l_new_losses = l_losses + 1
 
         # Persist
-        cur.execute("UPDATE wins SET wins=?, points=?, streak=? WHERE user_id=?",
+        cur.execute("UPDATE wins SET wins=?, points=?, streak=?, played=played+1 WHERE user_id=?",
                     (new_wins, new_points, new_streak, winner_id))
-        cur.execute("UPDATE wins SET points=?, streak=? WHERE user_id=?",
-                    (l_new_points, l_new_streak, loser_id))
+        cur.execute("UPDATE wins SET points=?, streak=?, losses=?, played=played+1 WHERE user_id=?",
+                    (l_new_points, l_new_streak, l_new_losses, loser_id))
         cur.execute("INSERT INTO matches (winner_id, loser_id) VALUES (?, ?)", (winner_id, loser_id))
         con.commit()
 
         return {
-            "winner_after": {"wins": new_wins, "points": new_points, "streak": new_streak, "delta": delta},
-            "loser_after": {"wins": l_wins, "points": l_new_points, "streak": l_new_streak, "delta": LOSS_POINTS},
+            "winner_after": {"wins": new_wins, "losses": w_losses, "points": new_points, "streak": new_streak, "delta": delta},
+            "loser_after": {"wins": l_wins, "losses": l_new_losses, "points": l_new_points, "streak": l_new_streak, "delta": LOSS_POINTS},
         }
 
-def update_points(guild: discord.Guild, winner_id: int, loser_id: int):
+async def update_points(guild: discord.Guild, winner_id: int, loser_id: int):
     """
-    Wrapper used by the reaction handler. Uses your SQLite-backed logic and
-    returns the shape the handler expects, including rank labels.
+    Wrapper used by the reaction handler. Runs the SQLite-backed logic on the
+    DB writer thread and returns the shape the handler expects, including rank labels.
     """
-    res = record_match_and_points(winner_id, loser_id)
+    res = await db_write(record_match_and_points, winner_id, loser_id)
+    note_opponents(winner_id, loser_id, time.time())
+    # Write-through to the in-memory leaderboard
+    for uid, after in ((winner_id, res["winner_after"]), (loser_id, res["loser_after"])):
+        LB_CACHE.upsert(uid, wins=after["wins"], losses=after["losses"], points=after["points"], streak=after["streak"])
     # Attach ranks based on the NEW points
     w_pts = res["winner_after"]["points"]
     l_pts = res["loser_after"]["points"]
@@ -963,17 +2231,15 @@ def update_points(guild: discord.Guild, winner_id: int, loser_id: int):
 
 
 def get_top_rows(limit: int = 10):
-    with sqlite3.connect(DB_PATH) as con:
+    with _db() as con:
         cur = con.execute("""
-            SELECT user_id, wins, points, streak
+            SELECT user_id, wins, points, streak, losses
             FROM wins
             ORDER BY points DESC, wins DESC, user_id ASC
             LIMIT ?
         """, (limit,))
         rows = []
-        for uid, wins, points, streak in cur.fetchall():
-            cur2 = con.execute("SELECT COUNT(*) FROM matches WHERE loser_id=?", (uid,))
-            losses = cur2.fetchone()[0]
+        for uid, wins, points, streak, losses in cur.fetchall():
             rows.append({
                 "user_id": uid,
                 "wins": wins,
@@ -985,36 +2251,158 @@ def get_top_rows(limit: int = 10):
 
 
 def get_user_row(user_id: int):
-    with sqlite3.connect(DB_PATH) as con:
+    with _db() as con:
         cur = con.execute("SELECT wins, points, streak FROM wins WHERE user_id=?", (user_id,))
         r = cur.fetchone()
         return (0,0,0) if not r else r
 
+def get_user_stats(user_id: int) -> dict:
+    """Single-row stats read: wins, losses, played, points, streak (zeros if unseen)."""
+    with _db() as con:
+        cur = con.execute(
+            "SELECT wins, losses, played, points, streak FROM wins WHERE user_id=?", (user_id,)
+        )
+        r = cur.fetchone()
+    wins, losses, played, points, streak = r if r else (0, 0, 0, 0, 0)
+    return {"wins": wins, "losses": losses, "played": played, "points": points, "streak": streak}
+
+def get_recent_matches(within_s: int):
+    """[(winner_id, loser_id, unix_time)] for matches in the last within_s seconds, oldest first."""
+    with _db() as con:
+        cur = con.execute("""
+            SELECT winner_id, loser_id, CAST(strftime('%s', match_time) AS INTEGER)
+            FROM matches
+            WHERE match_time >= datetime('now', ?)
+            ORDER BY id
+        """, (f"-{int(within_s)} seconds",))
+        return cur.fetchall()
+
+def get_opponent_counts(user_id: int):
+    """Return ([(beaten_id, count)], [(lost_to_id, count)]) aggregated in SQL."""
+    with _db() as con:
+        cur = con.cursor()
+        cur.execute("SELECT loser_id, COUNT(*) FROM matches WHERE winner_id=? GROUP BY loser_id", (user_id,))
+        beaten = cur.fetchall()
+        cur.execute("SELECT winner_id, COUNT(*) FROM matches WHERE loser_id=? GROUP BY winner_id", (user_id,))
+        lost_to = cur.fetchall()
+        return beaten, lost_to
+
 def get_leaderboard_position(user_id: int):
-    with sqlite3.connect(DB_PATH) as con:
+    """
+    1-based rank under ORDER BY points DESC, wins DESC, user_id ASC (None if unranked).
+    Counts the rows that sort ahead of the user; each COUNT is a range scan on idx_wins_rank.
+    """
+    with _db() as con:
+        r = con.execute("SELECT points, wins FROM wins WHERE user_id=?", (user_id,)).fetchone()
+        if not r:
+            return None
+        points, wins = r
         cur = con.execute("""
-            SELECT user_id
+            SELECT (SELECT COUNT(*) FROM wins WHERE points > ?)
+                 + (SELECT COUNT(*) FROM wins WHERE points = ? AND wins > ?)
+                 + (SELECT COUNT(*) FROM wins WHERE points = ? AND wins = ? AND user_id < ?)
+        """, (points, points, wins, points, wins, user_id))
+        return cur.fetchone()[0] + 1
+
+def get_all_rank_rows():
+    """Every `wins` row in leaderboard order (used once to warm LB_CACHE)."""
+    with _db() as con:
+        cur = con.execute("""
+            SELECT user_id, wins, points, streak, losses
             FROM wins
             ORDER BY points DESC, wins DESC, user_id ASC
         """)
-        pos = 1
-        for (uid,) in cur.fetchall():
-            if uid == user_id:
-                return pos
-            pos += 1
-        return None
+        return [
+            {"user_id": uid, "wins": wins, "points": points, "losses": losses, "streak": streak}
+            for uid, wins, points, streak, losses in cur.fetchall()
+        ]
+
+
+# ---------- In-memory leaderboard ----------
+class LeaderboardCache:
+    """
+    Sorted in-process mirror of `wins`, ordered like the leaderboard
+    (points DESC, wins DESC, user_id ASC). Loaded once at startup and patched
+    after every DB write, so top-N / rank / stats reads never touch SQLite.
+    Only mutate it from the event loop.
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self._keys: list[tuple[int, int, int]] = []   # sorted sort-keys
+        self._rows: dict[int, dict] = {}              # user_id -> row
+
+    @staticmethod
+    def _key(row: dict) -> tuple[int, int, int]:
+        return (-row["points"], -row["wins"], row["user_id"])
+
+    def load(self, rows: list[dict]):
+        self._rows = {r["user_id"]: dict(r) for r in rows}
+        self._keys = sorted(self._key(r) for r in self._rows.values())
+        self.loaded = True
+
+    def upsert(self, user_id: int, **fields):
+        old = self._rows.get(user_id)
+        if old is not None:
+            del self._keys[bisect.bisect_left(self._keys, self._key(old))]
+            row = {**old, **fields}
+        else:
+            row = {"user_id": user_id, "wins": 0, "points": 0, "losses": 0, "streak": 0, **fields}
+        self._rows[user_id] = row
+        bisect.insort(self._keys, self._key(row))
+
+    def reset(self):
+        """Mirror ?resetleaderboard: everyone stays listed with zeroed stats."""
+        for row in self._rows.values():
+            row.update(wins=0, points=0, losses=0, streak=0)
+        self._keys = sorted(self._key(r) for r in self._rows.values())
+
+    def top(self, limit: int = 10) -> list[dict]:
+        return [dict(self._rows[k[2]]) for k in self._keys[:limit]]
+
+    def get(self, user_id: int) -> dict | None:
+        row = self._rows.get(user_id)
+        return dict(row) if row else None
+
+    def rank(self, user_id: int) -> int | None:
+        row = self._rows.get(user_id)
+        if row is None:
+            return None
+        return bisect.bisect_left(self._keys, self._key(row)) + 1
+
+
+LB_CACHE = LeaderboardCache()
+
+
+async def leaderboard_top(limit: int = 10) -> list[dict]:
+    if LB_CACHE.loaded:
+        return LB_CACHE.top(limit)
+    return await db_read(get_top_rows, limit)
+
+async def leaderboard_position(user_id: int) -> int | None:
+    if LB_CACHE.loaded:
+        return LB_CACHE.rank(user_id)
+    return await db_read(get_leaderboard_position, user_id)
+
+async def leaderboard_stats(user_id: int) -> dict:
+    if LB_CACHE.loaded:
+        return LB_CACHE.get(user_id) or {"wins": 0, "losses": 0, "points": 0, "streak": 0}
+    return await db_read(get_user_stats, user_id)
+
 
 def _now(): return datetime.utcnow()
 
-def _expired(created_at_str: str) -> bool:
+def _parse_created(created_at_str: str) -> datetime:
     try:
-        created = datetime.fromisoformat(created_at_str.replace("Z",""))
+        return datetime.fromisoformat(created_at_str.replace("Z",""))
     except:
-        created = datetime.strptime(created_at_str, "%Y-%m-%d %H:%M:%S")
-    return _now() - created > timedelta(hours=CHALLENGE_TTL_HOURS)
+        return datetime.strptime(created_at_str, "%Y-%m-%d %H:%M:%S")
+
+def _expired(created_at_str: str) -> bool:
+    return _now() - _parse_created(created_at_str) > timedelta(hours=CHALLENGE_TTL_HOURS)
 
 def create_challenge(guild_id: int, challenger_id: int, opponent_id: int):
-    with sqlite3.connect(DB_PATH) as con:
+    with _db() as con:
         cur = con.execute("""
             SELECT id, created_at FROM challenges
             WHERE guild_id=? AND status='pending'
@@ -1033,7 +2421,7 @@ def create_challenge(guild_id: int, challenger_id: int, opponent_id: int):
         return ("ok", cur.fetchone()[0])
 
 def get_latest_incoming(guild_id: int, opponent_id: int):
-    with sqlite3.connect(DB_PATH) as con:
+    with _db() as con:
         cur = con.execute("""
             SELECT id, challenger_id, opponent_id, created_at
             FROM challenges
@@ -1043,7 +2431,7 @@ def get_latest_incoming(guild_id: int, opponent_id: int):
         return cur.fetchone()
 
 def get_pending_for_user(guild_id: int, user_id: int):
-    with sqlite3.connect(DB_PATH) as con:
+    with _db() as con:
         cur = con.execute("""
             SELECT id, challenger_id, opponent_id, created_at
             FROM challenges
@@ -1052,20 +2440,94 @@ def get_pending_for_user(guild_id: int, user_id: int):
         """, (guild_id, user_id, user_id))
         return cur.fetchall()
 
+def get_latest_outgoing(guild_id: int, challenger_id: int):
+    with _db() as con:
+        cur = con.execute("""
+            SELECT id, opponent_id, created_at
+            FROM challenges
+            WHERE guild_id=? AND challenger_id=? AND status='pending'
+            ORDER BY id DESC LIMIT 1
+        """, (guild_id, challenger_id))
+        return cur.fetchone()
+
+def expire_challenge_if_pending(challenge_id: int):
+    with _db() as con:
+        con.execute("UPDATE challenges SET status='expired' WHERE id=? AND status='pending'", (challenge_id,))
+
 def mark_challenge_status(challenge_id: int, status: str):
-    with sqlite3.connect(DB_PATH) as con:
+    with _db() as con:
         con.execute("UPDATE challenges SET status=? WHERE id=?", (status, challenge_id))
 
+def save_active_match(admin_msg_id: int, match: dict):
+    with _db() as con:
+        con.execute("""
+            INSERT INTO active_matches
+                (admin_msg_id, guild_id, a_id, b_id, announce_ch_id, announce_msg_id,
+                 text_chan_id, voice_chan_id, score, started_at, deadline)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(admin_msg_id) DO UPDATE SET
+                announce_ch_id=excluded.announce_ch_id, announce_msg_id=excluded.announce_msg_id,
+                text_chan_id=excluded.text_chan_id, voice_chan_id=excluded.voice_chan_id,
+                score=excluded.score, deadline=excluded.deadline
+        """, (admin_msg_id, match["guild_id"], match["a"], match["b"],
+              match.get("announce_ch_id"), match.get("announce_msg_id"),
+              match.get("text_chan_id"), match.get("voice_chan_id"),
+              match.get("score"), match["started_at"], match["deadline"]))
+
+def delete_active_match(admin_msg_id: int):
+    with _db() as con:
+        con.execute("DELETE FROM active_matches WHERE admin_msg_id=?", (admin_msg_id,))
+
+def load_active_matches() -> dict[int, dict]:
+    """All persisted in-flight matches, shaped like MATCHES entries."""
+    with _db() as con:
+        cur = con.execute("""
+            SELECT admin_msg_id, guild_id, a_id, b_id, announce_ch_id, announce_msg_id,
+                   text_chan_id, voice_chan_id, score, started_at, deadline
+            FROM active_matches
+        """)
+        out = {}
+        for (mid, gid, a_id, b_id, ann_ch, ann_msg, text_id, voice_id, score, started_at, deadline) in cur.fetchall():
+            out[mid] = {
+                "guild_id": gid,
+                "a": a_id,
+                "b": b_id,
+                "resolved": False,
+                "announce_msg_id": ann_msg,
+                "announce_ch_id": ann_ch,
+                "score": score,
+                "text_chan_id": text_id,
+                "voice_chan_id": voice_id,
+                "started_at": started_at,
+                "deadline": deadline,
+            }
+        return out
+
 def meta_get(key: str) -> str | None:
-    with sqlite3.connect(DB_PATH) as con:
+    with _db() as con:
         cur = con.execute("SELECT value FROM meta WHERE key=?", (key,))
         row = cur.fetchone()
         return row[0] if row else None
 
 def meta_set(key: str, value: str):
-    with sqlite3.connect(DB_PATH) as con:
+    with _db() as con:
         con.execute("INSERT INTO meta(key, value) VALUES(?, ?) ON CONFLICT(key) DO UPDATE SET value=excluded.value", (key, value))
 
+def reset_leaderboard_stats():
+    """Zero every player's stats and delete the match history."""
+    # Do destructive edits inside a normal transaction
+    with _db() as con:
+        con.execute("UPDATE wins SET wins = 0, points = 0, streak = 0, losses = 0, played = 0")
+        con.execute("DELETE FROM matches")
+        con.commit()
+
+    # VACUUM MUST be outside any transaction (the commit above closed it)
+    try:
+        _db().execute("VACUUM")
+    except Exception as e:
+        # Optional: not fatal; DB will still work even if VACUUM fails
+        print(f"[Bot2] VACUUM skipped: {e}")
+
 def _format_result_line(w_member, l_member, winner_id, loser_id, res=None, score:str|None=None):
     if res:
         w_pts = res["winner_after"]["points"]
@@ -1115,7 +2577,7 @@ async def rebuild_embed(guild):
                 MESSAGE_ID = message.id
                 # persist if key is available
                 try:
-                    set_setting(guild.id, COLOR_MSG_KEY, str(MESSAGE_ID))
+                    await db_write(set_setting, guild.id, COLOR_MSG_KEY, str(MESSAGE_ID))
                 except Exception:
                     pass
                 return
@@ -1126,9 +2588,10 @@ async def rebuild_embed(guild):
     embed = discord.Embed(title="🎨 Choose Your Color", color=discord.Color.blurple())
     embed.set_image(url="https://cdn.discordapp.com/attachments/1095053356478771202/1399960727661445170/image.png")
 
+    emojis = color_index(guild)["emojis"]
     lines = []
     for emoji_name, role_id in COLOR_ROLE_MAP.items():
-        emoji = discord.utils.get(guild.emojis, name=emoji_name)
+        emoji = emojis.get(emoji_name)
         lines.append(f"{(emoji or emoji_name)} | <@&{role_id}>")  # show name if emoji missing
     embed.description = "\n".join(lines)
 
@@ -1136,7 +2599,7 @@ async def rebuild_embed(guild):
 
     # Add reactions only for emojis that exist
     for emoji_name in COLOR_ROLE_MAP:
-        emoji = discord.utils.get(guild.emojis, name=emoji_name)
+        emoji = emojis.get(emoji_name)
         if emoji:
             try:
                 await new_msg.add_reaction(emoji)
@@ -1147,11 +2610,192 @@ async def rebuild_embed(guild):
 
     MESSAGE_ID = new_msg.id
     try:
-        set_setting(guild.id, COLOR_MSG_KEY, str(MESSAGE_ID))  # persist for future restarts
+        await db_write(set_setting, guild.id, COLOR_MSG_KEY, str(MESSAGE_ID))  # persist for future restarts
     except Exception:
         pass
 
 
+# ---------- Colour picks ----------
+# (guild_id, user_id) -> (panel message id, emoji name, emoji id) of the member's current
+# colour reaction, mirrored in `color_picks`. Switching colour removes exactly that one
+# reaction instead of paging through every reaction's user list.
+COLOR_PICKS: dict[tuple[int, int], tuple[int, str, int | None]] = {}
+COLOR_PICKS_BACKFILL_KEY = "color_picks_backfilled_msg"
+
+
+def save_color_picks(rows: list[tuple]):
+    with _db() as con:
+        con.executemany(
+            "REPLACE INTO color_picks (guild_id, user_id, message_id, emoji_name, emoji_id) VALUES (?, ?, ?, ?, ?)",
+            rows
+        )
+
+def delete_color_pick(guild_id: int, user_id: int):
+    with _db() as con:
+        con.execute("DELETE FROM color_picks WHERE guild_id=? AND user_id=?", (guild_id, user_id))
+
+def load_color_picks():
+    with _db() as con:
+        cur = con.execute("SELECT guild_id, user_id, message_id, emoji_name, emoji_id FROM color_picks")
+        return cur.fetchall()
+
+
+async def warm_color_picks():
+    COLOR_PICKS.clear()
+    for gid, uid, msg_id, name, emoji_id in await db_read(load_color_picks):
+        COLOR_PICKS[(gid, uid)] = (msg_id, name, emoji_id)
+
+
+async def set_color_pick(guild_id: int, user_id: int, emoji: discord.PartialEmoji):
+    """Record the member's new colour reaction; returns the previous one on the current panel (if any)."""
+    prev = COLOR_PICKS.get((guild_id, user_id))
+    COLOR_PICKS[(guild_id, user_id)] = (MESSAGE_ID, emoji.name, emoji.id)
+    await db_write(save_color_picks, [(guild_id, user_id, MESSAGE_ID, emoji.name, emoji.id)])
+    if prev and prev[0] == MESSAGE_ID and prev[1] != emoji.name:
+        return discord.PartialEmoji(name=prev[1], id=prev[2])
+    return None
+
+
+async def clear_color_pick(guild_id: int, user_id: int, emoji_name: str) -> bool | None:
+    """
+    Forget the member's pick if they just un-reacted the one we have on record.
+    Returns True if it was their current pick, False if another pick is on record, None if none is.
+    """
+    prev = COLOR_PICKS.get((guild_id, user_id))
+    if not prev or prev[0] != MESSAGE_ID:
+        return None
+    if prev[1] != emoji_name:
+        return False
+    COLOR_PICKS.pop((guild_id, user_id), None)
+    await db_write(delete_color_pick, guild_id, user_id)
+    return True
+
+
+async def backfill_color_picks(guild: discord.Guild):
+    """
+    One-off per panel message: page the panel's reactions once to seed COLOR_PICKS for
+    members who reacted before picks were recorded. Where a member has several colour
+    reactions, the one matching the colour role they hold wins.
+    """
+    if not MESSAGE_ID or await db_read(get_setting, guild.id, COLOR_PICKS_BACKFILL_KEY) == str(MESSAGE_ID):
+        return
+    channel = guild.get_channel(CHANNEL_ID)
+    if channel is None:
+        return
+    msg = await channel.fetch_message(MESSAGE_ID)
+
+    seen: dict[int, list[discord.PartialEmoji]] = {}
+    for react in msg.reactions:
+        emoji = react.emoji if isinstance(react.emoji, (discord.Emoji, discord.PartialEmoji)) else None
+        name = emoji.name if emoji else str(react.emoji)
+        if name not in COLOR_ROLE_MAP:
+            continue
+        async for u in react.users():
+            if not u.bot:
+                seen.setdefault(u.id, []).append(discord.PartialEmoji(name=name, id=getattr(emoji, "id", None)))
+
+    rows = []
+    for uid, emojis in seen.items():
+        if (guild.id, uid) in COLOR_PICKS:
+            continue
+        member = guild.get_member(uid)
+        held = {r.id for r in member.roles} if member else set()
+        pick = next((e for e in emojis if COLOR_ROLE_MAP[e.name] in held), emojis[0])
+        COLOR_PICKS[(guild.id, uid)] = (MESSAGE_ID, pick.name, pick.id)
+        rows.append((guild.id, uid, MESSAGE_ID, pick.name, pick.id))
+    if rows:
+        await db_write(save_color_picks, rows)
+    await db_write(set_setting, guild.id, COLOR_PICKS_BACKFILL_KEY, str(MESSAGE_ID))
+    print(f"[Bot2] Seeded {len(rows)} colour pick(s) from the panel reactions.")
+
+
+# ---------- Colour reaction worker ----------
+# Panel reactions only record the member's desired colour; one flush per member runs
+# COLOR_DEBOUNCE_S after their last click, adds the final colour role and removes any
+# other colour roles, then removes the reactions they clicked past. Flushes for the same
+# member are serialised, so the last click always wins. Only colour roles are touched
+# (per-role calls, never a full role list), so a flush and a queued ROLE_QUEUE edit can't
+# undo each other; flushes skip ROLE_QUEUE so a bulk job can't hold up an interactive pick.
+COLOR_DEBOUNCE_S = 1.5
+
+# (guild_id, user_id) -> {"role_id": int | None, "stale": {emoji_name: PartialEmoji}, "last": monotonic}
+_COLOR_PENDING: dict[tuple[int, int], dict] = {}
+_COLOR_FLUSHING: dict[tuple[int, int], asyncio.Task] = {}  # latest flush per member; each waits for the one before
+
+
+def queue_color_change(guild: discord.Guild, user_id: int, role_id: int | None,
+                       stale_emoji: discord.PartialEmoji | None = None):
+    """Set the member's desired colour role (None = no colour) and (re)start the debounce window."""
+    key = (guild.id, user_id)
+    entry = _COLOR_PENDING.get(key)
+    if entry is None:
+        entry = _COLOR_PENDING[key] = {"role_id": role_id, "stale": {}, "last": 0.0}
+        asyncio.create_task(_flush_color_change(guild, key))
+    entry["role_id"] = role_id
+    entry["last"] = time.monotonic()
+    if stale_emoji is not None:
+        entry["stale"][stale_emoji.name] = stale_emoji
+
+
+def drop_stale_reaction(guild_id: int, user_id: int, emoji_name: str):
+    """The member removed a superseded reaction themselves; nothing left to tidy for it."""
+    entry = _COLOR_PENDING.get((guild_id, user_id))
+    if entry:
+        entry["stale"].pop(emoji_name, None)
+
+
+async def _flush_color_change(guild: discord.Guild, key: tuple[int, int]):
+    # wait until the member has been quiet for COLOR_DEBOUNCE_S
+    while True:
+        wait = _COLOR_PENDING[key]["last"] + COLOR_DEBOUNCE_S - time.monotonic()
+        if wait <= 0:
+            break
+        await asyncio.sleep(wait)
+    entry = _COLOR_PENDING.pop(key)  # clicks from here on start a new window
+
+    me = asyncio.current_task()
+    prev = _COLOR_FLUSHING.get(key)
+    _COLOR_FLUSHING[key] = me
+    try:
+        if prev is not None:
+            await asyncio.wait({prev})
+        member = await get_member_safe(guild, key[1])
+        if member is None:
+            return
+        idx = color_index(guild)
+        role = guild.get_role(entry["role_id"]) if entry["role_id"] else None
+        final_name = None
+        if entry["role_id"]:
+            final_name = next((n for n, r in idx["by_emoji"].items() if r.id == entry["role_id"]), None)
+        to_add = role if role and role not in member.roles else None
+        to_remove = [r for r in member.roles if r.id in idx["role_ids"] and r.id != entry["role_id"]]
+
+        if to_add or to_remove:
+            try:
+                if to_add:
+                    await member.add_roles(to_add, reason="Colour panel selection")
+                if to_remove:
+                    await member.remove_roles(*to_remove, reason="Colour panel selection")
+                METRICS.inc("color_role_edits")
+            except Exception as e:
+                print(f"[Bot2] Failed to apply colour for {member.id}: {e}")
+
+        stale = [e for name, e in entry["stale"].items() if name != final_name]
+        if stale:
+            channel = guild.get_channel(CHANNEL_ID) or await bot2.fetch_channel(CHANNEL_ID)
+            panel = channel.get_partial_message(MESSAGE_ID)
+            for emoji in stale:
+                try:
+                    await panel.remove_reaction(emoji, member)
+                except Exception as e:
+                    print(f"[Bot2] Could not tidy up old reaction {emoji.name}: {e}")
+    except Exception as e:
+        print(f"[Bot2] Colour flush error for {key[1]}: {e}")
+    finally:
+        if _COLOR_FLUSHING.get(key) is me:
+            _COLOR_FLUSHING.pop(key, None)
+
+
 # ------- Bot 2: 1v1 flow with ADMIN CONFIRMATION -------
 
 def build_vs_embed(guild: discord.Guild, a: discord.Member, b: discord.Member, status: str = "Pending"):
@@ -1234,12 +2878,46 @@ async def update_public_announce_embed(
     await ann_msg.edit(embed=pub)
 
 
-async def start_match_from_challenge(guild: discord.Guild, a_id: int, b_id: int):
-    # --- REPLACE the first two lines in start_match_from_challenge ---
-    a = await get_member_safe(guild, a_id)
-    b = await get_member_safe(guild, b_id)
+async def start_match_from_challenge(guild: discord.Guild, a_id: int, b_id: int) -> bool:
+    """Start a 1v1 (cards + rooms). Returns False if either player is already in a live match."""
+    if player_busy(a_id) or player_busy(b_id):
+        print(f"[Bot2] Not starting {a_id} vs {b_id}: a player is already in a live match.")
+        return False
+    _STARTING_USERS.update((a_id, b_id))
+    return await _start_reserved(guild, a_id, b_id)
+
+
+async def _start_reserved(guild: discord.Guild, a_id: int, b_id: int) -> bool:
+    """Start a match for two players already held in _STARTING_USERS; releases them when done."""
+    try:
+        await _dequeue_user(a_id)
+        await _dequeue_user(b_id)
+        return await _start_match(guild, a_id, b_id)
+    finally:
+        _STARTING_USERS.difference_update((a_id, b_id))
+
+
+def _record_latency(stage: str, started: float):
+    """Record perf_counter() - started for a match-start stage."""
+    METRICS.observe(f"match_start_{stage}_seconds", time.perf_counter() - started)
+
+
+async def _start_match(guild: discord.Guild, a_id: int, b_id: int) -> bool:
+    """
+    Announce, admin card and rooms don't depend on each other, so they go out together;
+    the card's reactions and the room messages then run side by side.
+    Per-stage wall time goes to METRICS as match_start_<stage>_seconds.
+    """
+    t_start = time.perf_counter()
+    a, b = await asyncio.gather(get_member_safe(guild, a_id), get_member_safe(guild, b_id))
     if not a or not b:
-        return
+        return False
+
+    announce_ch = guild.get_channel(ANNOUNCE_CHANNEL_ID)
+    admin_ch = guild.get_channel(WIN_REPORT_CHANNEL_ID)
+    if not admin_ch:
+        print("[Bot2] WIN_REPORT_CHANNEL_ID not found; cannot create admin confirmation card.")
+        return False
 
     # Build the announce embed ONCE so we can reuse it (public + private room)
     announce = discord.Embed(
@@ -1257,84 +2935,118 @@ async def start_match_from_challenge(guild: discord.Guild, a_id: int, b_id: int)
     announce.set_image(url="https://media.discordapp.net/attachments/1095053356478771202/1404403392981368923/Screenshot_2025-08-11_at_10.57.38.png?format=webp&quality=lossless&width=3280&height=804")
 
     # 1) Public announce in the 1v1 channel (if configured)
-    announce_msg = None
-    announce_ch = guild.get_channel(ANNOUNCE_CHANNEL_ID)
-    if announce_ch:
+    async def _announce():
+        if not announce_ch:
+            return None
+        t = time.perf_counter()
         try:
-            announce_msg = await announce_ch.send(embed=announce)
+            return await announce_ch.send(embed=announce)
         except Exception as e:
             print(f"[Bot2] Could not post public announce: {e}")
+            return None
+        finally:
+            _record_latency("announce", t)
 
     # 2) Admin card in the results/confirmation channel
-    admin_ch = guild.get_channel(WIN_REPORT_CHANNEL_ID)
-    if not admin_ch:
-        print("[Bot2] WIN_REPORT_CHANNEL_ID not found; cannot create admin confirmation card.")
-        return
-
-    try:
-        admin_embed = build_vs_embed(guild, a, b, status="Pending admin confirmation")
-        admin_msg = await admin_ch.send(embed=admin_embed)
-
-        # Prepare storage (we'll fill text/voice ids right after room creation)
-        MATCHES[admin_msg.id] = {
-            "a": a.id,
-            "b": b.id,
-            "resolved": False,
-            "announce_msg_id": (announce_msg.id if announce_msg else None),
-            "announce_ch_id": (announce_ch.id if announce_ch else None),
-            "score": None,
-            "text_chan_id": None,
-            "voice_chan_id": None,
-        }
-
-        # Add reaction buttons for admins
-        await admin_msg.add_reaction("🅰️")
-        await admin_msg.add_reaction("🅱️")
-        await admin_msg.add_reaction("❌")
+    async def _admin_card():
+        t = time.perf_counter()
+        try:
+            return await admin_ch.send(embed=build_vs_embed(guild, a, b, status="Pending admin confirmation"))
+        finally:
+            _record_latency("admin_card", t)
 
-        # 3) Create the private text + voice rooms visible only to the two players (and admins)
+    # 3) Private text + voice rooms visible only to the two players (and admins)
+    async def _rooms():
+        t = time.perf_counter()
         try:
-            text_id, voice_id = await create_1v1_rooms(
+            return await create_1v1_rooms(
                 guild=guild,
                 player1=a,
                 player2=b,
                 base_channel=announce_ch or admin_ch  # fallback if announce channel missing
             )
-            MATCHES[admin_msg.id]["text_chan_id"] = text_id
-            MATCHES[admin_msg.id]["voice_chan_id"] = voice_id
-
-            # Post the SAME embed in the private text room, pinging both players
-            if text_id:
-                room = guild.get_channel(text_id)
-                if room:
-                    # Copy the public embed so we can tweak the title for the room
-                    room_embed = announce.copy()
-                    room_embed.title = "⚔️ 1v1 Confirmed — Private Room"
-                    # Optional: small hint that this is the place to upload
-                    room_embed.set_footer(text="Upload your result screenshot in this private room. Admins will confirm shortly.")
-
-                    # Ping both players in the room so they get notified
-                    content_ping = f"{a.mention} {b.mention} your 1v1 room is ready!{f' 🎙️ VC: <#{voice_id}>' if voice_id else ''}"
-                    await room.send(content=content_ping, embed=room_embed)
-                    # You can pin it if you want:
-                    # sent = await room.send(content=content_ping, embed=room_embed)
-                    # try: await sent.pin()
-                    # except: pass
-
-                    # And a compact helper message:
-                    if voice_id:
-                        await room.send(f"🎙️ Temporary voice channel: <#{voice_id}> — GLHF!")
-
         except Exception as e:
             print(f"[Bot2] Failed to create 1v1 private rooms: {e}")
+            return None, None
+        finally:
+            _record_latency("rooms", t)
 
-        # 4) Safety timeout: if no admin confirmation happens, auto-clean the rooms
-        asyncio.create_task(arm_match_timeout(guild, admin_msg.id, timeout_min=90))
-
-    except Exception as e:
-        print(f"[Bot2] Could not create admin confirmation card: {e}")
+    # _announce/_rooms swallow their own errors; only the admin card can fail the start
+    announce_msg, admin_msg, (text_id, voice_id) = await asyncio.gather(
+        _announce(), _admin_card(), _rooms(), return_exceptions=True
+    )
 
+    if isinstance(admin_msg, BaseException):
+        METRICS.inc("match_start_failures")
+        print(f"[Bot2] Could not create admin confirmation card: {admin_msg}")
+        # nothing references the rooms / announce without the card; undo them
+        if announce_msg:
+            try:
+                await announce_msg.delete()
+            except discord.HTTPException:
+                pass
+        await cleanup_1v1_rooms(guild, text_id, voice_id, delay_seconds=0)
+        return False
 
+    started_at = time.time()
+    _register_match(admin_msg.id, {
+        "guild_id": guild.id,
+        "a": a.id,
+        "b": b.id,
+        "resolved": False,
+        "announce_msg_id": (announce_msg.id if announce_msg else None),
+        "announce_ch_id": (announce_ch.id if announce_ch else None),
+        "score": None,
+        "text_chan_id": text_id,
+        "voice_chan_id": voice_id,
+        "started_at": started_at,
+        "deadline": started_at + MATCH_TIMEOUT_MIN * 60,
+    })
+
+    # Add reaction buttons for admins (sequential so they keep their order)
+    async def _reactions():
+        t = time.perf_counter()
+        try:
+            for emoji in ("🅰️", "🅱️", "❌"):
+                await admin_msg.add_reaction(emoji)
+        except Exception as e:
+            print(f"[Bot2] Could not add admin reactions: {e}")
+        finally:
+            _record_latency("reactions", t)
+
+    # Post the SAME embed in the private text room, pinging both players
+    async def _room_messages():
+        room = guild.get_channel(text_id) if text_id else None
+        if not room:
+            return
+        t = time.perf_counter()
+        try:
+            # Copy the public embed so we can tweak the title for the room
+            room_embed = announce.copy()
+            room_embed.title = "⚔️ 1v1 Confirmed — Private Room"
+            room_embed.set_footer(text="Upload your result screenshot in this private room. Admins will confirm shortly.")
+
+            # Ping both players in the room so they get notified
+            content_ping = f"{a.mention} {b.mention} your 1v1 room is ready!{f' 🎙️ VC: <#{voice_id}>' if voice_id else ''}"
+            await room.send(content=content_ping, embed=room_embed)
+            # And a compact helper message:
+            if voice_id:
+                await room.send(f"🎙️ Temporary voice channel: <#{voice_id}> — GLHF!")
+        except Exception as e:
+            print(f"[Bot2] Could not post in 1v1 room: {e}")
+        finally:
+            _record_latency("room_messages", t)
+
+    # 4) Persist + safety timeout alongside the remaining Discord calls
+    await asyncio.gather(
+        _persist_match(admin_msg.id),
+        arm_match_timeout(guild, admin_msg.id, MATCHES[admin_msg.id]["deadline"]),
+        _reactions(),
+        _room_messages(),
+    )
+    _record_latency("total", t_start)
+    METRICS.inc("matches_started")
+    return True
 
 
 class ChallengeView(View):
@@ -1354,7 +3066,7 @@ class ChallengeView(View):
     async def accept_btn(self, interaction: discord.Interaction, btn: Button):
         if not await self._guard(interaction): return
 
-        row = get_latest_incoming(interaction.guild.id, self.opponent_id)
+        row = await db_read(get_latest_incoming, interaction.guild.id, self.opponent_id)
         if not row:
             await interaction.response.send_message("No pending challenge to accept.", ephemeral=True)
             return
@@ -1362,14 +3074,20 @@ class ChallengeView(View):
         if cid != self.challenge_id:
             await interaction.response.send_message("This challenge has been superseded.", ephemeral=True)
             return
+        if player_busy(challenger_id) or player_busy(opponent_id):
+            await interaction.response.send_message("One of you is already in a live 1v1. Finish it first.", ephemeral=True)
+            return
         if _expired(created_at):
-            mark_challenge_status(cid, "expired")
+            await db_write(mark_challenge_status, cid, "expired")
             await interaction.response.send_message("This challenge expired. Ask for a new one.", ephemeral=True)
             for c in self.children: c.disabled = True
             await interaction.message.edit(view=self)
             return
 
-        mark_challenge_status(cid, "accepted")
+        await db_write(mark_challenge_status, cid, "accepted")
+        await SCHEDULER.cancel("challenge_expiry", cid)
+        METRICS.inc("challenges_accepted")
+        METRICS.observe("challenge_accept_seconds", (_now() - _parse_created(created_at)).total_seconds())
         for c in self.children: c.disabled = True
         await interaction.message.edit(content=f"✅ Challenge accepted by {interaction.user.mention}. Posting match for admin confirmation…", view=self)
         await start_match_from_challenge(interaction.guild, challenger_id, opponent_id)
@@ -1379,7 +3097,7 @@ class ChallengeView(View):
     async def decline_btn(self, interaction: discord.Interaction, btn: Button):
         if not await self._guard(interaction): return
 
-        row = get_latest_incoming(interaction.guild.id, self.opponent_id)
+        row = await db_read(get_latest_incoming, interaction.guild.id, self.opponent_id)
         if not row:
             await interaction.response.send_message("No pending challenge to decline.", ephemeral=True)
             return
@@ -1388,13 +3106,15 @@ class ChallengeView(View):
             await interaction.response.send_message("This challenge has been superseded.", ephemeral=True)
             return
         if _expired(created_at):
-            mark_challenge_status(cid, "expired")
+            await db_write(mark_challenge_status, cid, "expired")
             await interaction.response.send_message("This challenge already expired.", ephemeral=True)
             for c in self.children: c.disabled = True
             await interaction.message.edit(view=self)
             return
 
-        mark_challenge_status(cid, "declined")
+        await db_write(mark_challenge_status, cid, "declined")
+        await SCHEDULER.cancel("challenge_expiry", cid)
+        METRICS.inc("challenges_declined")
         for c in self.children: c.disabled = True
         await interaction.message.edit(content=f"❌ Challenge declined by {interaction.user.mention}.", view=self)
 
@@ -1527,10 +3247,17 @@ def _reset_guild_warnings(guild_id: int) -> int:
     conn.commit()
     return touched
 
-def warn_add(guild_id: int, user_id: int, moderator_id: int | None, reason: str | None):
+def warn_add(guild_id: int, user_id: int, moderator_id: int | None, reason: str | None) -> int:
+    """Increment + log one warning; returns the new count. Run via db_write so bumps never race."""
     current = _get_warn_count(guild_id, user_id)
     _set_warn_count(guild_id, user_id, current + 1)
     _log_warning(guild_id, user_id, moderator_id or 0, reason or "")
+    return current + 1
+
+def _count_warning_history(guild_id: int, user_id: int) -> int:
+    conn = _ensure_warn_conn()
+    cur = conn.execute("SELECT COUNT(*) FROM warnings_log WHERE guild_id=? AND user_id=?", (guild_id, user_id))
+    return int(cur.fetchone()[0] or 0)
 
 
 
@@ -1541,6 +3268,7 @@ def warn_add(guild_id: int, user_id: int, moderator_id: int | None, reason: str
 # ---- Global state / config ----
 # ===== Admin cancel support =====
 CANCEL_EMOJIS = ("❌", "🛑")  # either works for cancel
+CANCEL_CONCURRENCY = 4  # matches torn down at once by ?cancelmatch all / older
 
 
 # ===== MATCHMAKING QUEUE (BOT 2) =====
@@ -1550,11 +3278,26 @@ def _timeout_human() -> str:
     m = int(MM_TIMEOUT_S // 60)
     return f"{m} minute{'s' if m != 1 else ''}" if m else f"{MM_TIMEOUT_S} seconds"
 
-# Per-guild FIFO queue: guild_id -> deque of (user_id, joined_at_monotonic)
-MM_QUEUES: dict[int, deque[tuple[int, float]]] = {}
+# Per-guild FIFO queue: guild_id -> OrderedDict user_id -> joined_at_monotonic
+# (insertion order = wait order; O(1) append, pop-oldest and remove-by-user)
+MM_QUEUES: dict[int, OrderedDict[int, float]] = {}
 # Quick lookup to see if user is queued and where: user_id -> (guild_id, joined_at_monotonic)
 MM_INDEX: dict[int, tuple[int, float]] = {}
 
+# "fifo" pairs by arrival; "rating" pairs the closest points within a window that widens while waiting
+MM_MODE = "fifo"
+MM_RATING_WINDOW = 50           # ± points accepted right after joining
+MM_RATING_WINDOW_STEP = 25      # window grows by this many points...
+MM_RATING_WINDOW_EVERY_S = 20   # ...for every this many seconds waited
+# Queued ratings per guild, sorted: guild_id -> [(points, user_id)]; points snapshotted at join
+MM_RATINGS: dict[int, list[tuple[int, int]]] = {}
+MM_POINTS: dict[int, int] = {}
+# Rematch suppression: the queue won't pair someone with any of their last K opponents
+# faced within the cooldown. user_id -> deque of (opponent_id, unix_time), newest last.
+MM_REMATCH_K = 3
+MM_REMATCH_COOLDOWN_S = 30 * 60
+RECENT_OPPONENTS: dict[int, deque[tuple[int, float]]] = {}
+
 
 # ===== Leaderboard auto-post =====
 LEADERBOARD_UPDATE_MINUTES = 15
@@ -1565,6 +3308,14 @@ ADMIN_ROLE_ID = 1125786680121626704
 # ===== Bot 2: 1v1 Rooms Config =====
 ONEVONE_CATEGORY_ID = 1404418906382401546  # fixed category for 1v1 text/voice rooms
 
+# Warm pool of pre-created hidden room pairs per guild (0 = create/delete rooms per match)
+ROOM_POOL_SIZE = 0
+ROOM_POOL_IDLE_NAME = "1v1-pool-idle"
+ROOM_POOL_TOPIC_PREFIX = "1v1-pool:"
+ROOM_POOL_LEASE_TIMEOUT_S = 5.0
+ROOM_POOL: dict[int, deque[tuple[int, int]]] = {}  # guild_id -> idle (text_id, voice_id)
+_POOL_REFILLING: set[int] = set()
+
 
 # Booster cleanup
 BOT2_BOOSTER_ROLE_IDS = [1126898690284601396]
@@ -1604,8 +3355,14 @@ STATS_CHANNEL_ID = 1404420564772454482   # ?leaderboard, ?mywins
 DB_PATH = "leaderboard.db"
 CHALLENGE_TTL_HOURS = 2  # challenge validity window
 
-# message_id (admin-report message) -> match data
+MATCH_TIMEOUT_MIN = 90  # auto-clean rooms of matches never confirmed by an admin
+
+# message_id (admin-report message) -> match data (persisted in active_matches)
 MATCHES = {}  # {admin_msg_id: {"a": int, "b": int, "resolved": bool, "announce_msg_id": Optional[int], "announce_ch_id": Optional[int]}}
+# Secondary indexes over MATCHES, kept in sync by _register_match/_unregister_match
+MATCH_BY_USER: dict[int, int] = {}             # user_id -> admin_msg_id
+MATCH_BY_PAIR: dict[frozenset[int], int] = {}  # {a_id, b_id} -> admin_msg_id
+_STARTING_USERS: set[int] = set()              # players whose match is being created right now
 
 RESULTS_IMAGE_URL = "https://media.discordapp.net/attachments/1095053356478771202/1404403393555861505/Screenshot_2025-08-11_at_10.58.38.png?format=webp&quality=lossless&width=3280&height=804"
 
@@ -1613,9 +3370,18 @@ LEADERBOARD_CHANNEL_ID = 1404390200192401499
 LEADERBOARD_MESSAGE_ID = None  # load from your json/sql at startup
 
 LB_KEY = "leaderboard_message_id"
+LB_DIGEST_KEY = "leaderboard_image_digest"
 COLOR_MSG_KEY = "color_message_id"
 
 
+# ---- Deadline handlers ----
+SCHEDULER.register("match_timeout", _on_match_timeout)                  # rehydrated from active_matches
+SCHEDULER.register("room_cleanup", _on_room_cleanup, persist=True)
+SCHEDULER.register("challenge_expiry", _on_challenge_expiry, persist=True)
+SCHEDULER.register("queue_timeout", _on_queue_timeout)                  # queue itself is in-memory
+SCHEDULER.register("mm_recheck", _on_mm_recheck)
+
+
 # ---- Listeners ----
 @bot2.event
 async def on_command_error(ctx, error):
@@ -1637,20 +3403,122 @@ async def on_command_error(ctx, error):
     # fall back to your existing handler if any
     # raise error  # (uncomment if you want default behavior after our messages)
 
+# ===== BOOSTER ROLE INDEX =====
+# guild_id -> role_id -> member ids, for booster + custom roles only. Built per guild from
+# the member cache (on_ready, on_guild_join, or lazily on first use), then kept current by
+# on_member_update / on_member_remove, so the booster cleanup never has to walk every member
+# of the guild. It only says who to reconcile; booster status is always read off member.roles.
+ROLE_HOLDERS: dict[int, dict[int, set[int]]] = {}
+_TRACKED_ROLE_IDS = frozenset(BOT2_BOOSTER_ROLE_IDS) | frozenset(BOT2_CUSTOM_ROLE_IDS)
+
+
+def build_role_index(guild: discord.Guild):
+    holders = {rid: set() for rid in _TRACKED_ROLE_IDS}
+    for member in guild.members:
+        for role in member.roles:
+            if role.id in holders:
+                holders[role.id].add(member.id)
+    ROLE_HOLDERS[guild.id] = holders
+
+
+def _role_holders(guild: discord.Guild) -> dict[int, set[int]]:
+    if guild.id not in ROLE_HOLDERS:
+        build_role_index(guild)
+    return ROLE_HOLDERS[guild.id]
+
+
+def _index_member(member: discord.Member):
+    holders = _role_holders(member.guild)
+    has = {r.id for r in member.roles}
+    for rid, ids in holders.items():
+        if rid in has:
+            ids.add(member.id)
+        else:
+            ids.discard(member.id)
+
+
+def _unindex_member(guild_id: int, user_id: int):
+    for ids in ROLE_HOLDERS.get(guild_id, {}).values():
+        ids.discard(user_id)
+
+
+def _is_booster(member: discord.Member) -> bool:
+    return any(r.id in BOT2_BOOSTER_ROLE_IDS for r in member.roles)
+
+
+async def _strip_custom_roles_if_not_booster(member: discord.Member):
+    if _is_booster(member):
+        return
+    roles_to_remove = {r.id for r in member.roles if r.id in BOT2_CUSTOM_ROLE_IDS}
+    if roles_to_remove:
+        await ROLE_QUEUE.submit(member.guild.id, [(member.id, (), roles_to_remove)],
+                                reason="Lost All Booster Roles (Bot2)", job=f"booster:{member.guild.id}")
+
+
+@bot2.event
+async def on_member_update(before: discord.Member, after: discord.Member):
+    if before.roles == after.roles:
+        return
+    _index_member(after)
+    # losing the last booster role (or being handed a custom role without one) → strip custom roles
+    if any(r.id in BOT2_CUSTOM_ROLE_IDS for r in after.roles):
+        await _strip_custom_roles_if_not_booster(after)
+
+
+@bot2.event
+async def on_member_remove(member: discord.Member):
+    _unindex_member(member.guild.id, member.id)
+
+
+@bot2.event
+async def on_guild_join(guild: discord.Guild):
+    build_role_index(guild)
+
+
+@bot2.event
+async def on_guild_remove(guild: discord.Guild):
+    ROLE_HOLDERS.pop(guild.id, None)
+
+
+# Keep COLOR_INDEX in step with the guild's roles and emojis
+_COLOR_ROLE_IDS = frozenset(COLOR_ROLE_MAP.values())
+
+@bot2.event
+async def on_guild_role_create(role: discord.Role):
+    if role.id in _COLOR_ROLE_IDS:
+        refresh_color_index(role.guild)
+
+@bot2.event
+async def on_guild_role_delete(role: discord.Role):
+    if role.id in _COLOR_ROLE_IDS:
+        refresh_color_index(role.guild)
+
+@bot2.event
+async def on_guild_role_update(before: discord.Role, after: discord.Role):
+    if after.id in _COLOR_ROLE_IDS:
+        refresh_color_index(after.guild)
+
+@bot2.event
+async def on_guild_emojis_update(guild: discord.Guild, before, after):
+    refresh_color_index(guild)
+
+
 # ===== BOOSTER CHECK LOOP =====
+# Cleanup is event-driven (on_member_update); this only reconciles the custom-role holders
+# in case an event was missed, re-reading each one's roles from the member cache.
 @tasks.loop(minutes=10)
 async def booster_check_bot2():
     print(f"[Bot2] Booster check @ {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     for guild in bot2.guilds:
-        booster_roles = [guild.get_role(rid) for rid in BOT2_BOOSTER_ROLE_IDS if guild.get_role(rid)]
-        for member in guild.members:
-            if not any(r in member.roles for r in booster_roles):
-                roles_to_remove = [r for r in member.roles if r.id in BOT2_CUSTOM_ROLE_IDS]
-                if roles_to_remove:
-                    try:
-                        await member.remove_roles(*roles_to_remove, reason="Lost All Booster Roles (Bot2)")
-                    except Exception as e:
-                        print(f"[Bot2] Error on {member.display_name}: {e}")
+        holders = _role_holders(guild)
+        custom_holders = set().union(*(holders.get(rid, set()) for rid in BOT2_CUSTOM_ROLE_IDS))
+        for uid in custom_holders:
+            member = guild.get_member(uid)
+            if member is None:
+                _unindex_member(guild.id, uid)
+                continue
+            _index_member(member)
+            await _strip_custom_roles_if_not_booster(member)
 
 @tasks.loop(minutes=LEADERBOARD_UPDATE_MINUTES)
 async def leaderboard_updater():
@@ -1660,45 +3528,6 @@ async def leaderboard_updater():
         except Exception as e:
             print(f"[Bot2] Failed to update leaderboard: {e}")
 
-@tasks.loop(seconds=10)
-async def mm_queue_sweeper():
-    now = _now_mono()
-    to_timeout: list[tuple[int, int]] = []  # (guild_id, user_id)
-
-    # collect timeouts
-    for gid, q in list(MM_QUEUES.items()):
-        newq = deque()
-        for uid, joined in q:
-            if now - joined >= MM_TIMEOUT_S:
-                to_timeout.append((gid, uid))
-            else:
-                newq.append((uid, joined))
-        MM_QUEUES[gid] = newq
-
-    # apply timeouts + notify
-    for gid, uid in to_timeout:
-        MM_INDEX.pop(uid, None)
-        guild = bot2.get_guild(gid)
-        if guild:
-            member = guild.get_member(uid)
-            if member is None:
-                try:
-                    member = await guild.fetch_member(uid)
-                except Exception:
-                    member = None
-            if member:
-                await _notify_timeout(member)
-
-    # after pruning, try to match in each guild
-    for gid in list(MM_QUEUES.keys()):
-        guild = bot2.get_guild(gid)
-        if guild:
-            await _try_matchmake(guild)
-
-@mm_queue_sweeper.before_loop
-async def _mm_wait_ready():
-    await bot2.wait_until_ready()
-
 @bot2.event
 async def on_raw_reaction_remove(payload: discord.RawReactionActionEvent):
     try:
@@ -1710,27 +3539,27 @@ async def on_raw_reaction_remove(payload: discord.RawReactionActionEvent):
             return
 
         guild = bot2.get_guild(payload.guild_id) or await bot2.fetch_guild(payload.guild_id)
-        member = guild.get_member(payload.user_id)  # may be None if not cached
-        if member is None:
-            try:
-                member = await guild.fetch_member(payload.user_id)
-            except Exception:
-                return
 
         emoji_name = payload.emoji.name
-        role_id = COLOR_ROLE_MAP.get(emoji_name)
-        if not role_id:
+        if emoji_name not in COLOR_ROLE_MAP:
             return
-        role = guild.get_role(role_id)
+        role = color_index(guild)["by_emoji"].get(emoji_name)
         if not role:
             return
 
-        # If user removed the emoji that corresponds to their current colour, drop the role
-        if role in member.roles:
-            try:
-                await member.remove_roles(role, reason="Reaction removed from colour panel")
-            except Exception as e:
-                print(f"[Bot2] Failed to remove role on reaction_remove: {e}")
+        was_current = await clear_color_pick(guild.id, payload.user_id, emoji_name)
+        if was_current is False:
+            # a superseded reaction (ours or theirs) went away; their colour stays
+            drop_stale_reaction(guild.id, payload.user_id, emoji_name)
+            return
+        if was_current is None:
+            # no pick on record: fall back to the role they actually hold
+            member = await get_member_safe(guild, payload.user_id)
+            if member is None or role not in member.roles:
+                return
+
+        # User removed the emoji that corresponds to their current colour → drop the role
+        queue_color_change(guild, payload.user_id, None)
 
     except Exception as e:
         print(f"[Bot2] on_raw_reaction_remove error: {e}")
@@ -1759,58 +3588,14 @@ async def on_raw_reaction_add(payload: discord.RawReactionActionEvent):
         try:
             if 'CHANNEL_ID' in globals() and 'MESSAGE_ID' in globals() and 'COLOR_ROLE_MAP' in globals():
                 if payload.channel_id == CHANNEL_ID and payload.message_id == MESSAGE_ID:
-                    member = await get_member_safe(guild, payload.user_id)
-                    if member is None:
-                        return
-
-                    emoji_name = payload.emoji.name
-                    role_id = COLOR_ROLE_MAP.get(emoji_name)
-                    if not role_id:
-                        return
-
-                    role = guild.get_role(role_id)
+                    role = color_index(guild)["by_emoji"].get(payload.emoji.name)
                     if not role:
                         return
 
-                    # Collect all colour roles present in this guild
-                    color_roles = [r for rid in COLOR_ROLE_MAP.values() if (r := guild.get_role(rid))]
-
-                    # Remove any existing colour roles first (other than the chosen one)
-                    to_remove = [r for r in member.roles if r in color_roles and r.id != role.id]
-                    if to_remove:
-                        try:
-                            await member.remove_roles(*to_remove, reason="Enforcing single colour role")
-                        except Exception as e:
-                            print(f"[Bot2] Failed removing old color roles from {member.id}: {e}")
-
-                    # Add the chosen role if they don't already have it
-                    if role not in member.roles:
-                        try:
-                            await member.add_roles(role, reason="Selected new colour role")
-                        except Exception as e:
-                            print(f"[Bot2] Failed adding color role {role.id} to {member.id}: {e}")
-
-                    # Tidy up other colour reactions from this user on the same message
-                    try:
-                        channel = guild.get_channel(CHANNEL_ID) or await bot2.fetch_channel(CHANNEL_ID)
-                        msg = await channel.fetch_message(MESSAGE_ID)
-                        for react in msg.reactions:
-                            same = False
-                            if isinstance(react.emoji, str):
-                                same = (react.emoji == emoji_name)
-                            else:
-                                same = (getattr(react.emoji, "name", None) == emoji_name)
-
-                            if not same:
-                                async for u in react.users():
-                                    if u.id == member.id:
-                                        try:
-                                            await msg.remove_reaction(react.emoji, member)
-                                        except Exception:
-                                            pass
-                                        break
-                    except Exception as e:
-                        print(f"[Bot2] Could not tidy up old reactions: {e}")
+                    # Record the pick; the debounced worker swaps the role and tidies the
+                    # reaction it replaced in one go once the member stops clicking
+                    prev_emoji = await set_color_pick(guild.id, payload.user_id, payload.emoji)
+                    queue_color_change(guild, payload.user_id, role.id, stale_emoji=prev_emoji)
 
                     return  # handled colour panel; do not fall through to admin logic
         except Exception as e:
@@ -1865,18 +3650,25 @@ async def on_raw_reaction_add(payload: discord.RawReactionActionEvent):
         if emoji_str not in ("🅰️", "🅱️"):
             return
 
+        # Claim the match before the first await so a second confirm (or a cancel) can't
+        # interleave; the local `match` still drives everything below
+        match["resolved"] = True
+        _unregister_match(admin_msg_id)
+
         # Resolve players
         a_id = match["a"]
         b_id = match["b"]
 
-        # Fetch the admin message (for editing)
-        ch = guild.get_channel(payload.channel_id) or await bot2.fetch_channel(payload.channel_id)
-        if ch is None:
-            return
+        # Fetch the admin message (for editing); the result is recorded even if this fails
+        admin_msg = None
         try:
+            ch = guild.get_channel(payload.channel_id) or await bot2.fetch_channel(payload.channel_id)
             admin_msg = await ch.fetch_message(admin_msg_id)
-        except Exception:
-            return
+        except Exception as e:
+            print(f"[Bot2] Could not fetch admin message {admin_msg_id}: {e}")
+
+        t_confirm = time.perf_counter()
+        METRICS.observe("match_confirm_seconds", time.time() - _match_started_at(match))
 
         # Determine winner/loser from reaction
         winner_id = a_id if emoji_str == "🅰️" else b_id
@@ -1939,11 +3731,15 @@ async def on_raw_reaction_add(payload: discord.RawReactionActionEvent):
 
         admin_embed.set_footer(text=f"Result confirmed by {reactor.display_name}")
         admin_embed.set_image(url=RESULTS_IMAGE_URL)
-        await admin_msg.edit(embed=admin_embed)
+        if admin_msg is not None:
+            try:
+                await admin_msg.edit(embed=admin_embed)
+            except Exception as e:
+                print(f"[Bot2] Could not edit admin message {admin_msg_id}: {e}")
 
-        # Mark resolved
-        match["resolved"] = True
-        MATCHES[admin_msg_id] = match
+        # Drop the timeout and the persisted record (already evicted from MATCHES above)
+        await SCHEDULER.cancel("match_timeout", admin_msg_id)
+        await _forget_match(admin_msg_id)
 
         # Update PUBLIC announce embed if we have its reference
         ann_id = match.get("announce_msg_id")
@@ -2008,15 +3804,17 @@ async def on_raw_reaction_add(payload: discord.RawReactionActionEvent):
 
         # Delete the private text & voice channels after ~3 minutes
         try:
-            asyncio.create_task(cleanup_1v1_rooms(guild, text_id, voice_id, delay_seconds=180))
+            await schedule_room_cleanup(guild, text_id, voice_id, delay_seconds=180)
         except Exception as e:
             print(f"[Bot2] Failed to schedule cleanup for 1v1 rooms: {e}")
 
         # Refresh the leaderboard image after every result (best-effort)
         try:
             await refresh_leaderboard_message(guild)
+            METRICS.observe("confirm_to_leaderboard_seconds", time.perf_counter() - t_confirm)
         except Exception as e:
             print(f"[Bot2] Failed to refresh leaderboard after match: {e}")
+        METRICS.inc("matches_confirmed")
 
     except Exception as e:
         print(f"[Bot2] on_raw_reaction_add error: {e}")
@@ -2027,32 +3825,84 @@ async def on_raw_reaction_add(payload: discord.RawReactionActionEvent):
 
 # ---- Commands ----
 
+_STARTUP_RESTORED = False  # on_ready can fire again on reconnect; restore only once
+
 @bot2.event
 async def on_ready():
     print(f"Bot 2 is online: {bot2.user}")
 
     # --- init ---
     try:
-        init_db()
+        await db_write(init_db)
     except Exception as e:
         print(f"[Bot2] init_db error: {e}")
 
     try:
-        _init_settings()
+        await db_write(_init_settings)
     except Exception as e:
         print(f"[Bot2] _init_settings error: {e}")
 
+    try:
+        await db_write(warn_init_db)
+    except Exception as e:
+        print(f"[Bot2] warn_init_db error: {e}")
+
+    # Start the deadline scheduler and reload persisted jobs + in-flight 1v1s (once)
+    global _STARTUP_RESTORED
+    SCHEDULER.start()
+    ROLE_QUEUE.start()
+    try:
+        await start_metrics_server()
+    except Exception as e:
+        print(f"[Bot2] metrics server error: {e}")
+    if not _STARTUP_RESTORED:
+        _STARTUP_RESTORED = True
+        try:
+            await SCHEDULER.load()
+        except Exception as e:
+            print(f"[Bot2] SCHEDULER.load error: {e}")
+        try:
+            await ROLE_QUEUE.load()
+        except Exception as e:
+            print(f"[Bot2] ROLE_QUEUE.load error: {e}")
+        try:
+            await restore_active_matches()
+        except Exception as e:
+            print(f"[Bot2] restore_active_matches error: {e}")
+        try:
+            await warm_recent_opponents()
+        except Exception as e:
+            print(f"[Bot2] warm_recent_opponents error: {e}")
+        for g in bot2.guilds:
+            try:
+                await load_room_pool(g)
+            except Exception as e:
+                print(f"[Bot2] load_room_pool error in {g.name}: {e}")
+
+    # Warm the in-memory leaderboard once; later reads are served from it
+    try:
+        if not LB_CACHE.loaded:
+            LB_CACHE.load(await db_read(get_all_rank_rows))
+    except Exception as e:
+        print(f"[Bot2] leaderboard cache load error: {e}")
+
+    # Fonts + static leaderboard backgrounds, so the first render only draws cells
+    try:
+        await asyncio.get_running_loop().run_in_executor(_RENDER_POOL, _warm_leaderboard_templates)
+    except Exception as e:
+        print(f"[Bot2] leaderboard template warm-up error: {e}")
+
     # Preload message ids / settings for each guild (only where we have perms)
     for g in bot2.guilds:
         if not _has_perms(g):
             print(f"[Bot2] Skipping guild {g.id} during preload (insufficient perms).")
             continue
         try:
-            load_leaderboard_message_id_from_db(g.id)
+            await load_leaderboard_message_id_from_db(g.id)
         except Exception as e:
             print(f"[Bot2] load_leaderboard_message_id_from_db({g.id}) error: {e}")
         try:
-            load_color_message_id_from_db(g.id)
+            await load_color_message_id_from_db(g.id)
         except Exception as e:
             print(f"[Bot2] load_color_message_id_from_db({g.id}) error: {e}")
 
@@ -2067,6 +3917,13 @@ async def on_ready():
     except Exception as e:
         print(f"[Bot2] change_presence error: {e}")
 
+    # --- booster/custom role index (rebuilt on every ready: events may have been missed) ---
+    for g in bot2.guilds:
+        try:
+            build_role_index(g)
+        except Exception as e:
+            print(f"[Bot2] build_role_index error in {g.id}: {e}")
+
     # --- start background tasks (guard against multiple starts) ---
     try:
         if not booster_check_bot2.is_running():
@@ -2080,12 +3937,6 @@ async def on_ready():
     except Exception as e:
         print(f"[Bot2] leaderboard_updater start error: {e}")
 
-    try:
-        if not mm_queue_sweeper.is_running():
-            mm_queue_sweeper.start()
-    except Exception as e:
-        print(f"[Bot2] mm_queue_sweeper start error: {e}")
-
     # --- fix legacy duplicate colour roles on startup (only where we have perms) ---
     for g in bot2.guilds:
         if not _has_perms(g):
@@ -2105,6 +3956,14 @@ async def on_ready():
     except Exception as e:
         print(f"[Bot2] rebuild_embed error: {e}")
 
+    # --- colour picks: load recorded ones, seed from the panel once if it predates them ---
+    try:
+        await warm_color_picks()
+        if target:
+            await backfill_color_picks(target)
+    except Exception as e:
+        print(f"[Bot2] colour picks load error: {e}")
+
 
 @bot2.command(name="queue")
 @channel_is(MATCH_CHANNEL_ID)
@@ -2114,6 +3973,10 @@ async def join_queue(ctx: commands.Context):
     user = ctx.author
     if guild is None:
         return await ctx.reply("This command only works in a server.")
+    if player_busy(user.id):
+        return await ctx.reply("⚔️ You’re already in a live 1v1. Finish it before queueing again.")
+
+    pts = (await leaderboard_stats(user.id))["points"]
 
     # already queued?
     if user.id in MM_INDEX:
@@ -2127,8 +3990,13 @@ async def join_queue(ctx: commands.Context):
 
     q = _ensure_queue(guild.id)
     now_m = _now_mono()
-    q.append((user.id, now_m))
+    q[user.id] = now_m
     MM_INDEX[user.id] = (guild.id, now_m)
+    MM_POINTS[user.id] = pts
+    bisect.insort(MM_RATINGS.setdefault(guild.id, []), (pts, user.id))
+    await SCHEDULER.schedule("queue_timeout", user.id, time.time() + MM_TIMEOUT_S,
+                             {"guild_id": guild.id, "joined": now_m})
+    METRICS.inc("queue_joins")
 
     await ctx.reply(f"✅ Added to 1v1 queue. We’ll match you with the next available player (**{_timeout_human()}** timeout).")
 
@@ -2147,6 +4015,7 @@ async def leave_queue(ctx: commands.Context):
 
     removed = _remove_from_queue(guild.id, user.id)
     if removed:
+        await SCHEDULER.cancel("queue_timeout", user.id)
         await ctx.reply("✅ You left the 1v1 queue.")
     else:
         await ctx.reply("ℹ️ You aren’t in the queue.")
@@ -2167,6 +4036,10 @@ async def queue_status(ctx: commands.Context):
         joined = MM_INDEX[ctx.author.id][1]
         remain = max(0, int(MM_TIMEOUT_S - (_now_mono() - joined)))
         msg.append(f"⏳ Your timeout in **{remain}s**.")
+    avg_wait = METRICS.mean("queue_wait_seconds")
+    avg_spread = METRICS.mean("pair_points_gap")
+    if avg_wait is not None:
+        msg.append(f"⏱️ Avg wait **{avg_wait:.0f}s** · avg points gap **{avg_spread:.0f}** ({MM_MODE})")
     await ctx.reply("\n".join(msg))
 
 # ===== COMMANDS =====
@@ -2182,11 +4055,16 @@ async def challenge(ctx, opponent: discord.Member):
     if opponent.id == ctx.author.id:
         await ctx.send("Challenging yourself is wild… but no. 😅")
         return
+    if player_busy(ctx.author.id) or player_busy(opponent.id):
+        await ctx.send("One of you is already in a live 1v1. Finish it first.")
+        return
 
-    status, cid = create_challenge(ctx.guild.id, ctx.author.id, opponent.id)
+    status, cid = await db_write(create_challenge, ctx.guild.id, ctx.author.id, opponent.id)
     if status == "exists":
         await ctx.send(f"There’s already a pending challenge between you and {opponent.mention}.")
         return
+    await SCHEDULER.schedule("challenge_expiry", cid, time.time() + CHALLENGE_TTL_HOURS * 3600)
+    METRICS.inc("challenges_created")
 
     view = ChallengeView(challenge_id=cid, challenger_id=ctx.author.id, opponent_id=opponent.id)
     await ctx.send(f"⚔️ {opponent.mention}, **{ctx.author.display_name}** has challenged you to a 1v1!",
@@ -2195,7 +4073,7 @@ async def challenge(ctx, opponent: discord.Member):
 @bot2.command(name="challenges", help="See your pending 1v1 challenges (sent & received)")
 @channel_is(MATCH_CHANNEL_ID)
 async def challenges(ctx):
-    rows = get_pending_for_user(ctx.guild.id, ctx.author.id)
+    rows = await db_read(get_pending_for_user, ctx.guild.id, ctx.author.id)
     if not rows:
         await ctx.send("No pending challenges for you.")
         return
@@ -2219,14 +4097,7 @@ async def challenges(ctx):
 @bot2.command(name="cancelchallenge", help="Cancel your latest pending 1v1 challenge")
 @channel_is(MATCH_CHANNEL_ID)
 async def cancelchallenge(ctx):
-    with sqlite3.connect(DB_PATH) as con:
-        cur = con.execute("""
-            SELECT id, opponent_id, created_at
-            FROM challenges
-            WHERE guild_id=? AND challenger_id=? AND status='pending'
-            ORDER BY id DESC LIMIT 1
-        """, (ctx.guild.id, ctx.author.id))
-        row = cur.fetchone()
+    row = await db_read(get_latest_outgoing, ctx.guild.id, ctx.author.id)
 
     if not row:
         await ctx.send("You don’t have any pending challenges to cancel.")
@@ -2234,11 +4105,12 @@ async def cancelchallenge(ctx):
 
     cid, opponent_id, created_at = row
     if _expired(created_at):
-        mark_challenge_status(cid, "expired")
+        await db_write(mark_challenge_status, cid, "expired")
         await ctx.send("Your pending challenge was already expired.")
         return
 
-    mark_challenge_status(cid, "cancelled")
+    await db_write(mark_challenge_status, cid, "cancelled")
+    await SCHEDULER.cancel("challenge_expiry", cid)
     opp = ctx.guild.get_member(opponent_id)
     await ctx.send(f"🗑️ Challenge to {opp.mention if opp else 'that user'} cancelled.")
 
@@ -2259,33 +4131,24 @@ async def mywins(ctx, *, who: str = None):
         await ctx.send("❌ Couldn't find that user. Try a mention, ID, exact name, or a clearer partial.")
         return
 
-    # wins/losses from matches
-    with sqlite3.connect(DB_PATH) as con:
-        cur = con.cursor()
-        cur.execute("SELECT loser_id FROM matches WHERE winner_id=?", (member.id,))
-        wins_rows = cur.fetchall()
-        cur.execute("SELECT winner_id FROM matches WHERE loser_id=?", (member.id,))
-        loss_rows = cur.fetchall()
-
-    wins_count = len(wins_rows)
-    loss_count = len(loss_rows)
-
-    # points & streak
-    _w, points, streak = get_user_row(member.id)
+    # wins/losses/points/streak from the maintained counters
+    stats = await leaderboard_stats(member.id)
+    wins_count = stats["wins"]
+    loss_count = stats["losses"]
+    points = stats["points"]
+    streak = stats["streak"]
     tier = rank_for_points(points)
-    pos = get_leaderboard_position(member.id)
+    pos = await leaderboard_position(member.id)
 
     def names_count(rows):
-        counts = {}
-        for (uid,) in rows:
-            counts[uid] = counts.get(uid, 0) + 1
         parts = []
-        for uid, c in sorted(counts.items(), key=lambda kv: (-kv[1], kv[0])):
+        for uid, c in sorted(rows, key=lambda kv: (-kv[1], kv[0])):
             m = ctx.guild.get_member(uid)
             nm = m.display_name if m else f"User {uid}"
             parts.append(f"{nm} (x{c})" if c > 1 else nm)
         return ", ".join(parts) if parts else "None"
 
+    wins_rows, loss_rows = await db_read(get_opponent_counts, member.id)
     beaten = names_count(wins_rows)
     lostto = names_count(loss_rows)
 
@@ -2315,18 +4178,20 @@ async def clearcolors(ctx):
         await ctx.send("❌ You do not have permission to use this command.")
         return
 
-    count = 0
+    color_ids = {r.id for r in _color_roles_in_guild(ctx.guild)}
+    ops = []
     for member in ctx.guild.members:
-        to_remove = []
-        for role_id in COLOR_ROLE_MAP.values():
-            role = ctx.guild.get_role(role_id)
-            if role and role in member.roles:
-                to_remove.append(role)
-        if to_remove:
-            await member.remove_roles(*to_remove, reason="Admin: clearcolors")
-            count += len(to_remove)
+        theirs = {r.id for r in member.roles if r.id in color_ids}
+        if theirs:
+            ops.append((member.id, (), theirs))
+    if not ops:
+        return await ctx.send("✅ No color roles to clear.")
 
-    await ctx.send(f"✅ Cleared all color roles. Total removed: {count}")
+    count = sum(len(remove) for _uid, _add, remove in ops)
+    job = f"clearcolors:{ctx.guild.id}"
+    await ROLE_QUEUE.submit(ctx.guild.id, ops, reason="Admin: clearcolors", job=job)
+    msg = await ctx.send(f"⏳ Clearing {count} color role(s) from {len(ops)} member(s)…")
+    await report_role_job(msg, job, f"Cleared all color roles (total removed: {count})")
 
 
 
@@ -2337,16 +4202,17 @@ async def clearcolors(ctx):
 @commands.has_permissions(administrator=True)
 async def setleaderboard(ctx, channel: discord.TextChannel):
     # Persist the chosen channel
-    meta_set("leaderboard_channel_id", str(channel.id))
+    await db_write(meta_set, "leaderboard_channel_id", str(channel.id))
 
     # Build and post once immediately (image-based)
-    em, file = await build_leaderboard_embed_and_file(ctx.guild, limit=10)
+    em, file, digest = await _build_leaderboard_post(ctx.guild, limit=10)
     if not em:
         await ctx.send("No leaderboard data yet. I set the channel and will post when there are results.")
         return
 
     # Delete old one if we have it
-    old_id = LEADERBOARD_MESSAGE_ID or (int(get_setting(ctx.guild.id, LB_KEY)) if (get_setting(ctx.guild.id, LB_KEY) or "").isdigit() else None)
+    saved = await db_read(get_setting, ctx.guild.id, LB_KEY)
+    old_id = LEADERBOARD_MESSAGE_ID or (int(saved) if (saved or "").isdigit() else None)
     if old_id:
         try:
             old_msg = await channel.fetch_message(old_id)
@@ -2355,7 +4221,7 @@ async def setleaderboard(ctx, channel: discord.TextChannel):
             pass
 
     new_msg = await channel.send(embed=em, file=file)
-    await save_leaderboard_message_id(new_msg.id, ctx.guild.id)
+    await save_leaderboard_message_id(new_msg.id, ctx.guild.id, digest)
 
     await ctx.send(f"✅ Leaderboard channel set to {channel.mention}. I’ll keep it updated every {LEADERBOARD_UPDATE_MINUTES} minutes.")
 
@@ -2493,19 +4359,9 @@ async def reset_leaderboard(ctx, confirm: str = None):
         return
 
     try:
-        # 1) Do destructive edits inside a normal transaction
-        with sqlite3.connect(DB_PATH) as con:
-            con.execute("UPDATE wins SET wins = 0, points = 0, streak = 0")
-            con.execute("DELETE FROM matches")
-            con.commit()
-
-        # 2) VACUUM MUST be outside any transaction; use autocommit connection
-        try:
-            with sqlite3.connect(DB_PATH, isolation_level=None) as con2:
-                con2.execute("VACUUM")
-        except Exception as e:
-            # Optional: not fatal; DB will still work even if VACUUM fails
-            print(f"[Bot2] VACUUM skipped: {e}")
+        # 1) Wipe stats + history and VACUUM (on the DB writer thread)
+        await db_write(reset_leaderboard_stats)
+        LB_CACHE.reset()
 
         # 3) Refresh the live leaderboard
         await refresh_leaderboard_message(ctx.guild)
@@ -2516,7 +4372,7 @@ async def reset_leaderboard(ctx, confirm: str = None):
 
 @bot2.command(
     name="cancelmatch",
-    help="Admin: Cancel an in-progress 1v1 (no result). Usage: ?cancelmatch <admin_message_id> [reason...] OR ?cancelmatch @A @B [reason...]"
+    help="Admin: Cancel an in-progress 1v1 (no result). Usage: ?cancelmatch <admin_message_id> [reason...] OR ?cancelmatch @A @B [reason...] OR ?cancelmatch all|older <minutes> [reason...]"
 )
 @commands.has_role(ADMIN_ROLE_ID)
 async def cancelmatch_cmd(ctx: commands.Context, *args):
@@ -2529,9 +4385,32 @@ async def cancelmatch_cmd(ctx: commands.Context, *args):
             "Usage:\n"
             "`?cancelmatch <admin_message_id> [reason...]`\n"
             "or\n"
-            "`?cancelmatch @A @B [reason...]`"
+            "`?cancelmatch @A @B [reason...]`\n"
+            "or, in bulk\n"
+            "`?cancelmatch all [reason...]` / `?cancelmatch older <minutes> [reason...]`"
         )
 
+    guild = ctx.guild
+    actor = ctx.author
+
+    # Bulk: every live match, or those started more than N minutes ago
+    mode = args[0].lower()
+    if mode in ("all", "older"):
+        older_s = 0
+        rest = args[1:]
+        if mode == "older":
+            try:
+                older_s = float(rest[0]) * 60
+            except (IndexError, ValueError):
+                return await ctx.reply("Usage: `?cancelmatch older <minutes> [reason...]`")
+            rest = rest[1:]
+        reason = " ".join(rest).strip() or "Cancelled by admin"
+        targets = live_matches(guild.id, older_s)
+        if not targets:
+            return await ctx.reply("No live matches to cancel.")
+        done = await cancel_matches(guild, targets, reason=reason, actor=actor)
+        return await ctx.reply(f"✅ Cancelled **{done}/{len(targets)}** match(es).")
+
     reason = None
     admin_msg_id = None
     try:
@@ -2541,9 +4420,6 @@ async def cancelmatch_cmd(ctx: commands.Context, *args):
     except ValueError:
         pass  # Not an int, fall through
 
-    guild = ctx.guild
-    actor = ctx.author
-
     if admin_msg_id is not None:
         match = MATCHES.get(admin_msg_id)
         if not match or match.get("resolved"):
@@ -2558,13 +4434,7 @@ async def cancelmatch_cmd(ctx: commands.Context, *args):
     if len(ctx.message.mentions) >= 2:
         a = ctx.message.mentions[0]
         b = ctx.message.mentions[1]
-        target_id = None
-        for adm_id, m in list(MATCHES.items()):
-            if m.get("resolved"):
-                continue
-            if {m.get("a"), m.get("b")} == {a.id, b.id}:
-                target_id = adm_id
-                break
+        target_id = active_match_between(a.id, b.id)
 
         if not target_id:
             return await ctx.reply("No active match found for those two players.")
@@ -2581,6 +4451,27 @@ async def cancelmatch_cmd(ctx: commands.Context, *args):
     )
 
 
+@bot2.command(name="metrics", help="Admin: Show 1v1 pipeline timings (p50/p95 bucket bounds, seconds) and counters")
+@commands.has_role(ADMIN_ROLE_ID)
+async def metrics_cmd(ctx: commands.Context):
+    lines = METRICS.summary_lines()
+    if not lines:
+        return await ctx.reply("No metrics recorded yet.")
+    body = "\n".join(lines)
+    await ctx.reply(f"```\n{body[:1900]}\n```")
+
+
+@bot2.command(name="deadlines", help="Admin: Show pending scheduled deadlines by kind")
+@commands.has_role(ADMIN_ROLE_ID)
+async def deadlines_cmd(ctx: commands.Context):
+    counts = SCHEDULER.pending_counts()
+    lines = [f"`{kind}` → **{n}**" for kind, n in sorted(counts.items())]
+    nxt = SCHEDULER.next_due()
+    if nxt is not None:
+        lines.append(f"Next due in **{max(0, int(nxt - time.time()))}s**")
+    await ctx.reply("\n".join(lines) or "No deadline kinds registered.")
+
+
 # =========================
 # WARN COMMANDS
 # =========================
@@ -2609,11 +4500,8 @@ async def warn_cmd(ctx: commands.Context, member: discord.Member, *, reason: Opt
     user_id = member.id
 
     try:
-        # Increment + log (your helpers)
-        current = _get_warn_count(guild_id, user_id)
-        new_count = current + 1
-        _set_warn_count(guild_id, user_id, new_count)
-        _log_warning(guild_id, user_id, ctx.author.id, reason)
+        # Increment + log (your helpers, on the DB writer thread)
+        new_count = await db_write(warn_add, guild_id, user_id, ctx.author.id, reason)
 
         base = f"⚠️ **{member.mention}** has been warned."
         detail = f" Current warnings: **{new_count}**."
@@ -2636,7 +4524,7 @@ async def warn_cmd(ctx: commands.Context, member: discord.Member, *, reason: Opt
                 else f"\n⚠️ Tried to timeout but failed: `{info}`"
             )
             if WARN_RESET_AT_5:
-                _set_warn_count(guild_id, user_id, 0)
+                await db_write(_set_warn_count, guild_id, user_id, 0)
                 detail = " Current warnings: **0** (auto-reset after 5)."
 
         embed = discord.Embed(
@@ -2691,8 +4579,8 @@ async def warn_cmd(ctx: commands.Context, member: discord.Member, *, reason: Opt
 @warning_only()
 async def warnings_cmd(ctx: commands.Context, member: Optional[discord.Member] = None):
     target = member or ctx.author
-    count = _get_warn_count(ctx.guild.id, target.id)
-    history = _get_warning_history(ctx.guild.id, target.id, limit=10)
+    count = await db_read(_get_warn_count, ctx.guild.id, target.id)
+    history = await db_read(_get_warning_history, ctx.guild.id, target.id, limit=10)
 
     em = discord.Embed(
         title=f"Warnings for {target}",
@@ -2733,21 +4621,19 @@ async def clearwarnings_cmd(ctx: commands.Context, member: discord.Member, *, re
 
     # --- snapshot before reset (count + history size) ---
     try:
-        before_count = _get_warn_count(guild_id, user_id)
+        before_count = await db_read(_get_warn_count, guild_id, user_id)
     except Exception:
         before_count = 0
 
     # Count history entries (for nicer reporting)
     try:
-        conn = _ensure_warn_conn()
-        cur = conn.execute("SELECT COUNT(*) FROM warnings_log WHERE guild_id=? AND user_id=?", (guild_id, user_id))
-        history_entries = int(cur.fetchone()[0] or 0)
+        history_entries = await db_read(_count_warning_history, guild_id, user_id)
     except Exception:
         history_entries = 0
 
     # --- perform reset (count -> 0, purge history) ---
     try:
-        _reset_user_warnings(guild_id, user_id)
+        await db_write(_reset_user_warnings, guild_id, user_id)
         reset_ok = True
         reset_err = None
     except Exception as e:
@@ -2823,7 +4709,12 @@ if not BOT2_TOKEN:
     raise RuntimeError("Missing BOT2_TOKEN in environment/.env")
 
 async def main():
-    await bot2.start(BOT2_TOKEN)
+    try:
+        await bot2.start(BOT2_TOKEN)
+    finally:
+        await stop_metrics_server()
+        await close_http_session()
+        shutdown_db()
 
 if __name__ == "__main__":
     try: